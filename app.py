@@ -1,25 +1,63 @@
-from flask import Flask
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response
 from flask_login import LoginManager
 from .config import DevelopmentConfig
-from .models import db, User
+from .models import db
 from .routes import auth_bp, product_bp, order_bp, cart_bp, admin_bp
 from .dashboard import dashboard_bp
+from .catalog import CatalogCache
+from .rollups import rebuild_rollups_command
+from .usercache import UserCache, load_user
+from .passwords import PasswordHasher
+from .sqlite_tuning import apply_pragmas
+from .migrations import ensure_indexes, migrate_indexes_command
+from .metrics import init_metrics, instrument_engine, cache_collector
+from .slowlog import init_slow_query_log, install_slow_query_log
+from .serializers import init_json_provider
+from .search import ensure_search_index
+from .events import create_broker, StreamLimiter
+from .jobs import queue_gauges
+from .invoices import create_invoice_cache, create_invoice_pool, render_invoices_command
+from .memo import create_dashboard_memo
+from .replica import BIND, configure_analytics_bind, create_analytics_replica, refresh_analytics_db_command
+from . import tasks
 
 def create_app(config_class=DevelopmentConfig):
     """Create and configure the Flask app"""
     app = Flask(__name__)
     app.config.from_object(config_class)
+    init_json_provider(app)
+    analytics_db_path = configure_analytics_bind(app)
     
     # Initialize extensions
     db.init_app(app)
+    app.extensions['catalog_cache'] = CatalogCache(
+        app.config.get('CATALOG_CACHE_SIZE', 512),
+        app.config.get('CATALOG_STOCK_MAX_AGE', 5.0)
+    )
+    app.extensions['password_hasher'] = PasswordHasher.from_config(app.config)
+    app.extensions['user_cache'] = UserCache(
+        app.config.get('USER_CACHE_SIZE', 1024),
+        app.config.get('USER_CACHE_TTL', 60)
+    )
+    app.extensions['invoice_cache'] = create_invoice_cache(app)
+    app.extensions['invoice_pool'] = create_invoice_pool(app.config)
+    app.extensions['dashboard_memo'] = create_dashboard_memo(app.config)
+    app.extensions['dashboard_pool'] = ThreadPoolExecutor(
+        max_workers=app.config.get('DASHBOARD_BATCH_WORKERS', 4),
+        thread_name_prefix='dashboard'
+    )
+    app.extensions['event_broker'] = create_broker(app.config)
+    app.extensions['event_streams'] = StreamLimiter(
+        app.config.get('SSE_MAX_STREAMS', 100),
+        app.config.get('SSE_MAX_STREAMS_PER_USER', 3)
+    )
     
     login_manager = LoginManager()
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
+    login_manager.user_loader(load_user)
     
     # Register blueprints
     app.register_blueprint(auth_bp)
@@ -29,9 +67,33 @@ def create_app(config_class=DevelopmentConfig):
     app.register_blueprint(admin_bp)
     app.register_blueprint(dashboard_bp)
     
+    # CLI commands
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(migrate_indexes_command)
+    app.cli.add_command(render_invoices_command)
+    app.cli.add_command(refresh_analytics_db_command)
+    
     # Create tables
     with app.app_context():
-        db.create_all()
+        apply_pragmas(db.engine, app.config.get('SQLITE_PRAGMAS'))
+        # Only the main database; the analytics bind is a read-only copy of it
+        db.create_all(bind_key=None)
+        ensure_indexes()
+        ensure_search_index()
+        app.extensions['analytics_db'] = create_analytics_replica(app, analytics_db_path)
+        if app.config.get('METRICS_ENABLED'):
+            metrics = init_metrics(app, db.engine)
+            if BIND in db.engines:
+                instrument_engine(db.engines[BIND])
+            metrics.collectors.append(cache_collector('catalog', app.extensions['catalog_cache']))
+            metrics.collectors.append(cache_collector('user', app.extensions['user_cache']))
+            metrics.collectors.append(cache_collector('invoice', app.extensions['invoice_cache']))
+            if app.extensions['dashboard_memo'] is not None:
+                metrics.collectors.append(cache_collector('dashboard', app.extensions['dashboard_memo']))
+            metrics.gauges.append(queue_gauges)
+        slow_log = init_slow_query_log(app, db.engine)
+        if slow_log is not None and BIND in db.engines:
+            install_slow_query_log(db.engines[BIND], slow_log)
     
     # Basic route
     @app.route('/')
@@ -42,6 +104,11 @@ def create_app(config_class=DevelopmentConfig):
     def health():
         return {'status': 'healthy'}
     
+    if app.config.get('METRICS_ENABLED'):
+        @app.route('/metrics')
+        def metrics_endpoint():
+            return Response(app.extensions['metrics'].render(), mimetype='text/plain; version=0.0.4')
+    
     return app
 
 if __name__ == '__main__':
@@ -0,0 +1,93 @@
+"""
+Concurrent checkout stress test: no oversell, steady throughput
+
+Usage: python -m backend.benchmarks.checkout_stress [--threads 8] [--stock 500] [--seconds 10]
+
+Every thread logs in as its own customer and repeatedly checks out a cart
+holding the same scarce product. At the end the sold quantity must equal the
+stock that disappeared, and stock must never go negative.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from sqlalchemy import func
+from ..app import create_app
+from ..config import ProductionConfig
+from ..models import db, User, Product, OrderItem
+
+def make_app(path, threads):
+    # Every buyer logs in at once; let them all queue for hashing
+    return create_app(type('StressConfig', (ProductionConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'PASSWORD_HASH_ITERATIONS': 1024,
+        'PASSWORD_HASH_QUEUE': threads
+    }))
+
+def seed(threads, stock):
+    for i in range(threads):
+        user = User(username=f'buyer{i}', email=f'buyer{i}@example.com')
+        user.set_password('buyer')
+        db.session.add(user)
+    db.session.add(Product(name='Limited Cake', price=30, category='Cakes', stock=stock))
+    db.session.add(Product(name='Croissant', price=3, category='Pastries', stock=10 ** 9))
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--stock', type=int, default=500)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'stress.db'), args.threads)
+        with app.app_context():
+            seed(args.threads, args.stock)
+
+        outcomes = Counter()
+        per_second = Counter()
+        lock = threading.Lock()
+        start = time.perf_counter()
+        deadline = start + args.seconds
+
+        def buyer(n):
+            rng = random.Random(n)
+            client = app.test_client()
+            client.post('/api/auth/login', json={'username': f'buyer{n}', 'password': 'buyer'})
+            while time.perf_counter() < deadline:
+                client.delete('/api/cart/clear')
+                client.post('/api/cart/add', json={'product_id': 1, 'quantity': rng.randint(1, 3)})
+                client.post('/api/cart/add', json={'product_id': 2, 'quantity': 1})
+                status = client.post('/api/orders', json={}).status_code
+                with lock:
+                    outcomes[status] += 1
+                    if status == 201:
+                        per_second[int(time.perf_counter() - start)] += 1
+
+        threads = [threading.Thread(target=buyer, args=(i,)) for i in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        with app.app_context():
+            stock = db.session.get(Product, 1).stock
+            sold = db.session.query(func.coalesce(func.sum(OrderItem.quantity), 0)).filter(
+                OrderItem.product_id == 1
+            ).scalar()
+            db.engine.dispose()
+
+    print(f'responses: {dict(outcomes)}')
+    print(f'checkouts/s by second: {[per_second[s] for s in range(int(args.seconds))]}')
+    print(f'initial stock {args.stock}, sold {sold}, remaining {stock}')
+    ok = stock >= 0 and sold + stock == args.stock and set(outcomes) <= {201, 409}
+    print('PASS' if ok else 'FAIL: oversold or unexpected errors')
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+Micro-benchmark of password hashing throughput per policy setting
+
+Usage: python -m backend.benchmarks.hashing [--seconds 2] [--workers 1 2 4]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash
+from ..passwords import hash_method
+
+SETTINGS = [
+    ('pbkdf2:sha256', 100000),
+    ('pbkdf2:sha256', 600000),
+    ('pbkdf2:sha256', 1000000),
+    ('pbkdf2:sha512', 210000),
+    ('scrypt', 16384),
+    ('scrypt', 32768),
+]
+
+def measure(method, workers, seconds):
+    """Hashes per second for one method with ``workers`` hashing threads"""
+    deadline = time.perf_counter() + seconds
+
+    def work():
+        done = 0
+        while time.perf_counter() < deadline:
+            generate_password_hash('correct horse battery staple', method)
+            done += 1
+        return done
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        total = sum(pool.map(lambda _: work(), range(workers)))
+    return total / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2])
+    args = parser.parse_args()
+
+    print(f"{'method':<28}{'workers':>8}{'hashes/s':>12}{'ms/hash':>10}")
+    for algorithm, iterations in SETTINGS:
+        method = hash_method(algorithm, iterations)
+        for workers in args.workers:
+            rate = measure(method, workers, args.seconds)
+            print(f'{method:<28}{workers:>8}{rate:>12.1f}{workers * 1000 / rate:>10.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""
+Load test of the Flask API with per-endpoint latency and SQL counts
+
+Usage: python -m backend.benchmarks.load [--memory] [--threads 8] [--seconds 20]
+                                         [--mix browse=60,cart=20,checkout=10,admin=10]
+                                         [--output baseline.json] [--compare old.json]
+
+Seeds users, products, carts and orders, then drives weighted scenario mixes
+through the Flask test client from several threads. Reports p50/p95/p99
+latency, requests per second and SQL queries per request for every endpoint,
+and writes the results to a JSON baseline that later runs can compare against.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import event, insert
+from ..app import create_app
+from ..config import TestingConfig, ProductionConfig
+from ..models import db, User, Product, Order, OrderItem, Cart
+from ..rollups import rebuild_rollups
+
+CATEGORIES = ['Cakes', 'Cupcakes', 'Pastries', 'Breads', 'Cookies', 'Custom']
+
+def make_app(db_path=None, threads=1):
+    """In-memory TestingConfig app, or a tuned file-backed one
+
+    The in-memory database is a single shared connection, so it can only be
+    driven from one thread. Each thread logs in two clients at once, so the
+    hashing queue is sized to let them all wait rather than shed logins.
+    """
+    if db_path is None:
+        return create_app(TestingConfig)
+    return create_app(type('LoadConfig', (ProductionConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.abspath(db_path)}',
+        'PASSWORD_HASH_ITERATIONS': 1024,
+        'PASSWORD_HASH_QUEUE': 2 * threads
+    }))
+
+def seed(users, products, orders, carts, rng):
+    """Insert a data set of the requested size with Core executemany"""
+    admin = User(username='admin', email='admin@example.com', is_admin=True)
+    admin.set_password('admin')
+    db.session.add(admin)
+    db.session.flush()
+    password_hash = admin.password_hash
+    now = datetime.utcnow()
+
+    db.session.execute(insert(User), [
+        {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': password_hash,
+         'is_admin': False, 'created_at': now, 'updated_at': now}
+        for i in range(users)
+    ])
+    db.session.execute(insert(Product), [
+        {'name': f'Product {i}', 'description': 'Freshly baked', 'price': round(rng.uniform(2, 60), 2),
+         'category': CATEGORIES[i % len(CATEGORIES)], 'stock': 10 ** 6, 'is_available': True,
+         'created_at': now, 'updated_at': now}
+        for i in range(products)
+    ])
+    orders_rows, items_rows = [], []
+    for order_id in range(1, orders + 1):
+        created = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+        lines = [(rng.randint(1, products), rng.randint(1, 3), round(rng.uniform(2, 60), 2))
+                 for _ in range(rng.randint(1, 4))]
+        orders_rows.append({
+            'id': order_id, 'user_id': rng.randint(2, users + 1),
+            'total_amount': sum(q * p for _, q, p in lines),
+            'status': rng.choice(['pending', 'confirmed', 'shipped', 'delivered']),
+            'created_at': created, 'updated_at': created
+        })
+        items_rows += [{'order_id': order_id, 'product_id': pid, 'quantity': q, 'unit_price': p}
+                       for pid, q, p in lines]
+    if orders_rows:
+        db.session.execute(insert(Order), orders_rows)
+        db.session.execute(insert(OrderItem), items_rows)
+    cart_rows = {(rng.randint(2, users + 1), rng.randint(1, products)) for _ in range(carts)}
+    if cart_rows:
+        db.session.execute(insert(Cart), [
+            {'user_id': u, 'product_id': p, 'quantity': 1, 'added_at': now} for u, p in cart_rows
+        ])
+    db.session.commit()
+    rebuild_rollups()
+
+# Each scenario is a list of (method, url, json) built from a random source
+def browse(rng, products):
+    category = rng.choice(CATEGORIES)
+    return [
+        ('get', '/api/products', None),
+        ('get', f'/api/products/category/{category}', None),
+        ('get', f'/api/products/{rng.randint(1, products)}', None),
+    ]
+
+def cart(rng, products):
+    return [
+        ('post', '/api/cart/add', {'product_id': rng.randint(1, products), 'quantity': 1}),
+        ('get', '/api/cart', None),
+        ('post', '/api/cart/batch', {'operations': [
+            {'op': 'set', 'product_id': rng.randint(1, products), 'quantity': rng.randint(1, 3)}
+            for _ in range(5)
+        ]}),
+    ]
+
+def checkout(rng, products):
+    return [
+        ('post', '/api/cart/add', {'product_id': rng.randint(1, products), 'quantity': 1}),
+        ('post', '/api/orders', {}),
+        ('get', '/api/orders', None),
+    ]
+
+def admin(rng, products):
+    return [
+        ('get', '/api/dashboard/overview', None),
+        ('get', '/api/dashboard/revenue?period=month', None),
+        ('get', '/api/dashboard/top-products', None),
+        ('get', '/api/dashboard/inventory', None),
+        ('get', '/api/dashboard/customer-stats', None),
+        ('get', '/api/dashboard/category-stats', None),
+        ('get', '/api/dashboard/performance-summary', None),
+        ('get', '/api/admin/orders?limit=50', None),
+    ]
+
+SCENARIOS = {'browse': browse, 'cart': cart, 'checkout': checkout, 'admin': admin}
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run_load(app, mix, threads, seconds, users, products, seed_value=0):
+    """Drive the scenario mix and return per-endpoint samples"""
+    local = threading.local()
+
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        local.queries = getattr(local, 'queries', 0) + 1
+
+    # Dashboard reads go to the analytics replica's engine
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', count_query)
+
+    adapter = app.url_map.bind('')
+    samples = defaultdict(list)
+    lock = threading.Lock()
+    names, weights = zip(*mix.items())
+    deadline = time.perf_counter() + seconds
+
+    def worker(n):
+        rng = random.Random(seed_value + n)
+        customer = app.test_client()
+        customer.post('/api/auth/login', json={'username': f'user{n % users}', 'password': 'admin'})
+        admin_client = app.test_client()
+        admin_client.post('/api/auth/login', json={'username': 'admin', 'password': 'admin'})
+        mine = defaultdict(list)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            client = admin_client if name == 'admin' else customer
+            for method, url, body in SCENARIOS[name](rng, products):
+                local.queries = 0
+                start = time.perf_counter()
+                response = getattr(client, method)(url, **({'json': body} if body is not None else {}))
+                elapsed = time.perf_counter() - start
+                rule = adapter.match(url.split('?')[0], method=method.upper(), return_rule=True)[0].rule
+                mine[f'{method.upper()} {rule}'].append((elapsed, local.queries, response.status_code))
+        with lock:
+            for key, values in mine.items():
+                samples[key].extend(values)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    for engine in engines:
+        event.remove(engine, 'before_cursor_execute', count_query)
+    return samples, elapsed
+
+def summarize(samples, elapsed):
+    results = {}
+    for key, values in sorted(samples.items()):
+        latencies = sorted(v[0] * 1000 for v in values)
+        results[key] = {
+            'requests': len(values),
+            'rps': round(len(values) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'queries_per_request': round(sum(v[1] for v in values) / len(values), 2),
+            'errors': sum(1 for v in values if v[2] >= 500),
+        }
+    return results
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, tolerance):
+    """Print endpoints whose p95 slowed past ``tolerance`` or that gained queries"""
+    regressions = 0
+    for key, current in results.items():
+        old = baseline.get('endpoints', {}).get(key)
+        if not old:
+            continue
+        p95_change = (current['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0
+        # Cache hit ratios make query counts jitter slightly between runs
+        more_queries = current['queries_per_request'] > old['queries_per_request'] + 0.5
+        if p95_change > tolerance or more_queries:
+            regressions += 1
+            print(f"REGRESSION {key}: p95 {old['p95_ms']} -> {current['p95_ms']} ms, "
+                  f"queries {old['queries_per_request']} -> {current['queries_per_request']}")
+    return regressions
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, weight = part.split('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f'unknown scenario {name}')
+        mix[name] = float(weight)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--memory', action='store_true', help='use TestingConfig in-memory (single thread)')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--products', type=int, default=100)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--carts', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=20.0)
+    parser.add_argument('--mix', type=parse_mix, default='browse=60,cart=20,checkout=10,admin=10')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown (0.2 = 20%%)')
+    args = parser.parse_args()
+    if args.memory and args.threads != 1:
+        parser.error('--memory requires --threads 1')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = None if args.memory else os.path.join(tmp, 'load.db')
+        app = make_app(db_path, args.threads)
+        with app.app_context():
+            seed(args.users, args.products, args.orders, args.carts, random.Random(args.seed))
+        samples, elapsed = run_load(app, args.mix, args.threads, args.seconds,
+                                    args.users, args.products, args.seed)
+        with app.app_context():
+            db.engine.dispose()
+
+    results = summarize(samples, elapsed)
+    print(f"{'endpoint':<48}{'req':>7}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'sql/req':>9}")
+    for key, r in results.items():
+        print(f"{key:<48}{r['requests']:>7}{r['rps']:>9.1f}{r['p50_ms']:>9.2f}"
+              f"{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['queries_per_request']:>9.2f}")
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'database': 'memory' if args.memory else 'file',
+            'threads': args.threads,
+            'seconds': args.seconds,
+            'mix': args.mix,
+            'data': {'users': args.users, 'products': args.products,
+                     'orders': args.orders, 'carts': args.carts},
+        },
+        'endpoints': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for key in ('database', 'threads', 'mix', 'data'):
+            if baseline['meta'].get(key) != report['meta'][key]:
+                print(f"warning: baseline {key} differs: {baseline['meta'].get(key)} vs {report['meta'][key]}")
+        regressions = compare(results, baseline, args.tolerance)
+        print(f'{regressions} endpoints regressed')
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Benchmark of ORM to_dict serialization against the column-level path
+
+Usage: python -m backend.benchmarks.serialization [--products 500] [--orders 2000]
+                                                  [--page 200] [--repeat 20]
+
+Builds the product listing and one admin order page both ways, checks that
+the response bodies are byte-identical (compact and indented), and reports
+the time per response for each path.
+"""
+import argparse
+import random
+import sys
+import time
+from flask.json.provider import DefaultJSONProvider
+from ..config import TestingConfig
+from ..app import create_app
+from ..loading import order_query
+from ..models import db, Product
+from ..pagination import keyset_page
+from ..serializers import OrjsonProvider, product_query, product_dicts, order_query_rows, order_dicts, orjson
+from .load import seed
+
+def orm_products():
+    return [p.to_dict() for p in Product.query.filter_by(is_available=True).all()]
+
+def fast_products():
+    return product_dicts(product_query().filter_by(is_available=True).all())
+
+def orm_orders(page):
+    orders, _ = keyset_page(order_query('admin.get_all_orders'), page)
+    return [order.to_dict() for order in orders]
+
+def fast_orders(page):
+    orders, _ = keyset_page(order_query_rows(), page)
+    return order_dicts(orders)
+
+def timed(fn, repeat):
+    """Best time of ``repeat`` calls, in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--page', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app(TestingConfig)
+    stdlib = DefaultJSONProvider(app)
+    fast = OrjsonProvider(app) if orjson is not None else stdlib
+    if orjson is None:
+        print('orjson is not installed; the fast path uses the stdlib encoder')
+
+    with app.test_request_context():
+        seed(args.users, args.products, args.orders, 0, random.Random(0))
+        # Exercises the non-ASCII fallback
+        db.session.add(Product(name='Crème brûlée', price=6.5, category='Pastries', stock=10))
+        db.session.commit()
+
+        cases = [
+            ('products', orm_products, fast_products),
+            (f'orders (page of {args.page})', lambda: orm_orders(args.page), lambda: fast_orders(args.page)),
+        ]
+        mismatches = 0
+        print(f"{'response':<24}{'orm+stdlib ms':>15}{'columns+fast ms':>17}{'speedup':>9}")
+        for name, orm, columns in cases:
+            for compact in (True, False):
+                stdlib.compact = fast.compact = compact
+                if stdlib.response(orm()).get_data() != fast.response(columns()).get_data():
+                    mismatches += 1
+                    print(f'MISMATCH {name} (compact={compact})')
+            stdlib.compact = fast.compact = True
+            before = timed(lambda: stdlib.response(orm()).get_data(), args.repeat)
+            after = timed(lambda: fast.response(columns()).get_data(), args.repeat)
+            print(f'{name:<24}{before:>15.2f}{after:>17.2f}{before / after:>8.1f}x')
+    return 1 if mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Mixed read/write throughput with and without the SQLite tuning profile
+
+Usage: python -m backend.benchmarks.sqlite_profile [--seconds 5] [--readers 6] [--writers 2]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from ..app import create_app
+from ..config import Config, ProductionConfig
+from ..models import db, User, Product, Order, OrderItem
+
+def make_config(path, tuned):
+    base = ProductionConfig if tuned else Config
+    attrs = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'PASSWORD_HASH_ITERATIONS': 1024}
+    if not tuned:
+        attrs['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'check_same_thread': False}}
+    return type('BenchConfig', (base,), attrs)
+
+def seed(products=50):
+    user = User(username='bench', email='bench@example.com')
+    user.set_password('bench')
+    db.session.add(user)
+    for i in range(products):
+        db.session.add(Product(name=f'Product {i}', price=5 + i % 20, category=f'C{i % 5}', stock=1000))
+    db.session.commit()
+    return user.id
+
+def read_op():
+    Product.query.filter_by(is_available=True).all()
+    db.session.query(Order.status, func.count(Order.id), func.sum(Order.total_amount)).group_by(Order.status).all()
+
+def write_op(user_id, rng):
+    order = Order(user_id=user_id, total_amount=0)
+    db.session.add(order)
+    db.session.flush()
+    for _ in range(3):
+        db.session.add(OrderItem(order_id=order.id, product_id=rng.randint(1, 50), quantity=1, unit_price=10))
+    order.total_amount = 30
+    db.session.commit()
+
+def run(tuned, seconds, readers, writers):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(make_config(os.path.join(tmp, 'bench.db'), tuned))
+        with app.app_context():
+            user_id = seed()
+        counts = {'read': 0, 'write': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def worker(kind, n):
+            rng = random.Random(n)
+            with app.app_context():
+                while time.perf_counter() < deadline:
+                    try:
+                        read_op() if kind == 'read' else write_op(user_id, rng)
+                        key = kind
+                    except OperationalError:
+                        db.session.rollback()
+                        key = 'errors'
+                    with lock:
+                        counts[key] += 1
+                db.session.remove()
+
+        threads = [threading.Thread(target=worker, args=('read', i)) for i in range(readers)]
+        threads += [threading.Thread(target=worker, args=('write', i)) for i in range(writers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        with app.app_context():
+            db.engine.dispose()
+        return {k: v / seconds for k, v in counts.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--readers', type=int, default=6)
+    parser.add_argument('--writers', type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{'profile':<10}{'reads/s':>10}{'writes/s':>10}{'errors/s':>10}")
+    for tuned in (False, True):
+        result = run(tuned, args.seconds, args.readers, args.writers)
+        name = 'tuned' if tuned else 'default'
+        print(f"{name:<10}{result['read']:>10.1f}{result['write']:>10.1f}{result['errors']:>10.1f}")
+
+if __name__ == '__main__':
+    main()
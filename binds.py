@@ -0,0 +1,20 @@
+"""
+Session that can send an app context's queries to another configured bind
+"""
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+
+class RoutingSession(Session):
+    """Session whose queries go to the bind named by ``g.db_bind`` when it is set
+
+    Models without a bind key normally always use the default engine;
+    setting ``g.db_bind`` to a key of SQLALCHEMY_BINDS redirects them for
+    the rest of the app context (for a request, the rest of the request).
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            key = g.get('db_bind')
+            if key is not None and key in self._db.engines:
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,106 @@
+"""
+Versioned in-process cache of serialized product catalog responses
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request
+from .generations import get_generations, bump_generation
+
+CATALOG = 'catalog'
+# Bumped by checkout, which only changes stock levels
+STOCK = 'stock'
+
+class CatalogCache:
+    """Bounded LRU of pre-serialized JSON bodies for one catalog version
+
+    Each body also records the stock version it was built at. Checkouts
+    only bump the stock version, and a body stays servable for
+    ``stock_max_age`` seconds after stock changes, so a stream of checkouts
+    costs each worker at most one rebuild per key per ``stock_max_age``
+    instead of one per checkout.
+    """
+
+    def __init__(self, max_entries=512, stock_max_age=5.0):
+        self.max_entries = max_entries
+        self.stock_max_age = stock_max_age
+        self.version = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, version, stock, key):
+        """(stock version, body) usable at these versions, or None"""
+        with self._lock:
+            if version != self.version:
+                # A newer (or older) catalog is live; nothing cached applies
+                self.entries.clear()
+                self.version = version
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] != stock and time.monotonic() - entry[1] > self.stock_max_age:
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0], entry[2]
+
+    def put(self, version, stock, key, body):
+        with self._lock:
+            if version != self.version:
+                return
+            self.entries[key] = (stock, time.monotonic(), body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.version = None
+
+def catalog_versions():
+    """(catalog, stock) versions shared by every worker through the database"""
+    return get_generations((CATALOG, STOCK))
+
+def bump_catalog_version():
+    """Invalidate cached catalog responses; call before committing product writes"""
+    bump_generation(CATALOG)
+
+def bump_stock_version():
+    """Mark cached stock levels as out of date; call before committing stock-only changes"""
+    bump_generation(STOCK)
+
+def _etag(version, stock, key):
+    digest = hashlib.sha1(f'{version}:{stock}:{key}'.encode()).hexdigest()[:16]
+    return f'catalog-{digest}'
+
+def cached_catalog_response(key, build):
+    """Serve a catalog JSON response from cache, honoring If-None-Match
+
+    ``build`` returns the data to serialize, or None if the resource does
+    not exist (in which case None is returned); it only runs on a miss.
+    Responses carry an ETag derived from the catalog and stock versions the
+    body was built at, so a client revalidating an unchanged catalog gets a
+    304 without any serialization.
+    """
+    cache = current_app.extensions['catalog_cache']
+    version, stock = catalog_versions()
+    
+    entry = cache.get(version, stock, key)
+    if entry is None:
+        data = build()
+        if data is None:
+            return None
+        entry = (stock, current_app.json.response(data).get_data())
+        cache.put(version, stock, key, entry[1])
+    
+    etag = _etag(version, entry[0], key)
+    body = b'' if request.if_none_match.contains(etag) else entry[1]
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
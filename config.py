@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 class Config:
     """Base configuration"""
@@ -8,6 +9,108 @@ class Config:
     SESSION_COOKIE_SECURE = False
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
+    # PRAGMAs run on every new SQLite connection
+    SQLITE_PRAGMAS = {}
+    # Loading strategy for Order.items / OrderItem.product: selectin, joined or lazy
+    ORDER_LOADING_STRATEGY = 'selectin'
+    # Per-endpoint overrides, e.g. {'admin.get_all_orders': 'joined'}
+    ORDER_LOADING_OVERRIDES = {}
+    # Keyset pagination for order listings
+    ORDERS_PAGE_SIZE = 50
+    ORDERS_MAX_PAGE_SIZE = 200
+    # Rows fetched per server-side cursor batch in streaming exports
+    EXPORT_BATCH_SIZE = 1000
+    # Maximum serialized catalog responses kept per worker
+    CATALOG_CACHE_SIZE = 512
+    # Seconds a cached catalog response may keep showing stock levels from
+    # before a checkout; product edits invalidate it at once
+    CATALOG_STOCK_MAX_AGE = 5.0
+    # Per-worker cache of logged-in users; TTL bounds staleness across workers
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_TTL = 60
+    # Password hashing policy; hashes made with any other method are
+    # replaced on next login. Algorithm is pbkdf2:sha256, pbkdf2:sha512 or
+    # scrypt (iterations = N, a power of two). The default matches
+    # Werkzeug's, so existing scrypt hashes are kept as they are
+    PASSWORD_HASH_ALGORITHM = 'scrypt'
+    PASSWORD_HASH_ITERATIONS = 32768
+    # Threads each server process handles requests on (match the WSGI
+    # server's thread setting)
+    REQUEST_THREADS = 8
+    # Threads dedicated to hashing, and how many requests may wait on them.
+    # The queue must stay below REQUEST_THREADS or hashing can tie up every
+    # request thread before HashingBusy sheds load; None uses half of them
+    PASSWORD_HASH_WORKERS = 2
+    PASSWORD_HASH_QUEUE = None
+    # Per-endpoint latency and SQL metrics served at /metrics. With several
+    # worker processes, point METRICS_DIR at a directory they all share and
+    # each scrape reports the totals of every running worker. Workers are
+    # told apart by pid, so they must run on one host (and PID namespace)
+    METRICS_ENABLED = True
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = 5.0
+    # Record statements slower than the threshold, with their query plans,
+    # at /api/admin/slow-queries and optionally as JSON lines in a file
+    SLOW_QUERY_LOG_ENABLED = os.environ.get('SLOW_QUERY_LOG') == '1'
+    SLOW_QUERY_THRESHOLD_MS = 100
+    SLOW_QUERY_LOG_SIZE = 200
+    SLOW_QUERY_LOG_FILE = os.environ.get('SLOW_QUERY_LOG_FILE')
+    # Encode JSON responses with orjson when it is installed
+    FAST_JSON = True
+    # Order status event streams. 'local' only reaches streams in the same
+    # process; 'sqlite' shares events between workers through EVENTS_DB_PATH
+    EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'local')
+    EVENTS_DB_PATH = os.environ.get('EVENTS_DB_PATH')
+    SSE_HEARTBEAT = 15
+    SSE_MAX_DURATION = 300
+    SSE_MAX_STREAMS = 100
+    SSE_MAX_STREAMS_PER_USER = 3
+    # Background jobs (run_worker.py). Failed attempts retry after
+    # BASE * 2^(attempt-1) seconds, capped at MAX, with jitter
+    JOBS_WORKERS = 2
+    JOBS_POLL_INTERVAL = 1.0
+    JOBS_MAX_ATTEMPTS = 5
+    JOBS_BACKOFF_BASE = 5
+    JOBS_BACKOFF_MAX = 3600
+    # Running jobs not finished within the lease are taken over by another worker
+    JOBS_LEASE_SECONDS = 300
+    JOBS_RETENTION_DAYS = 7
+    LOW_STOCK_THRESHOLD = 5
+    # Rendered invoice HTML, shared by all workers; defaults to instance/invoices
+    INVOICE_CACHE_DIR = None
+    INVOICE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+    # Processes used for batch invoice archives (None = CPU count), shared by
+    # all archive requests; a request may span at most INVOICE_ARCHIVE_MAX_DAYS
+    INVOICE_WORKERS = None
+    INVOICE_ARCHIVE_MAX_DAYS = 31
+    # Dashboard queries read a copy of the main SQLite file (default
+    # instance/analytics.db), re-copied with the online backup API once it is
+    # older than ANALYTICS_DB_MAX_STALENESS seconds and the data has changed.
+    # Each refresh copies the whole file, so the interval is stretched to
+    # ANALYTICS_DB_STALENESS_PER_MB seconds per MiB of database (a 1 GiB
+    # file is re-copied about every 17 minutes, not every 30 seconds).
+    # Only used in WAL mode (see ProductionConfig). The copy is made by a
+    # background thread in each worker, or with ANALYTICS_DB_REFRESH off by
+    # the refresh-analytics-db command run from cron. Pages per backup step;
+    # -1 copies in one step, which in WAL mode never blocks writers
+    ANALYTICS_DB_ENABLED = False
+    ANALYTICS_DB_PATH = os.environ.get('ANALYTICS_DB_PATH')
+    ANALYTICS_DB_MAX_STALENESS = 30.0
+    ANALYTICS_DB_STALENESS_PER_MB = 1.0
+    ANALYTICS_DB_REFRESH = True
+    ANALYTICS_DB_PAGES_PER_STEP = -1
+    # Threads shared by all /api/dashboard/batch requests, and how long each
+    # widget may run (and separately, wait for a thread) before the batch
+    # returns without it
+    DASHBOARD_BATCH_WORKERS = 4
+    DASHBOARD_WIDGET_TIMEOUT = 5.0
+    # Per-worker memo of dashboard responses. Writes to the tables a widget
+    # reads invalidate it once they reach the database the widget reads (with
+    # the analytics copy, after the next copy); the TTL caps how stale time
+    # windows get.
+    # Set the TTL to 0 to turn the memo off
+    DASHBOARD_CACHE_SIZE = 256
+    DASHBOARD_CACHE_TTL = 30
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -18,9 +121,31 @@ class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     TESTING = False
+    # WAL lets dashboard reads run alongside checkout writes; NORMAL sync is
+    # durable across app crashes in WAL mode and far cheaper than FULL
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 268435456,
+        'cache_size': -65536,
+        'temp_store': 'MEMORY'
+    }
+    ANALYTICS_DB_ENABLED = True
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 10,
+        'max_overflow': 10,
+        'pool_timeout': 10,
+        'pool_recycle': 3600,
+        'connect_args': {'timeout': 5, 'check_same_thread': False}
+    }
 
 class TestingConfig(Config):
     """Testing configuration"""
     DEBUG = True
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    PASSWORD_HASH_ITERATIONS = 1024
+    # The in-memory database is a single shared connection
+    DASHBOARD_BATCH_WORKERS = 1
+    INVOICE_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'toady-test-invoices')
@@ -1,46 +1,82 @@
-from flask import Blueprint, request, jsonify
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
-from .models import db, User, Product, Order, OrderItem
+from .models import (
+    db, User, Product, Order, OrderItem,
+    DailySales, DailyProductSales, DailyCategorySales, DailyStatusCount, CustomerSales
+)
+from .loading import order_query
+from .rollups import transition_summary, PLACED
+from .replica import use_analytics_db
+from .memo import memoize_dashboard
+from .generations import ORDERS, USERS
+from .catalog import CATALOG, STOCK
 from datetime import datetime, timedelta
 from sqlalchemy import func, extract
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/api/dashboard')
+dashboard_bp.before_request(use_analytics_db)
+
+FULFILMENT_TRANSITIONS = [('pending', 'confirmed'), ('confirmed', 'shipped'), ('shipped', 'delivered')]
+
+# Dashboard routes the batch endpoint can run, by path under /api/dashboard
+WIDGETS = (
+    'overview', 'revenue', 'top-products', 'customer-stats', 'inventory',
+    'order-analytics', 'sales-trend', 'category-stats', 'performance-summary'
+)
 
 # ==================== DASHBOARD STATISTICS ====================
 
+def status_counts():
+    """Orders per current status, read from the daily status rollup"""
+    rows = db.session.query(
+        DailyStatusCount.status,
+        func.sum(DailyStatusCount.orders)
+    ).group_by(DailyStatusCount.status).having(func.sum(DailyStatusCount.orders) > 0).all()
+    return {status: count for status, count in rows}
+
+def sales_totals(since=None):
+    """(orders, revenue) from the daily sales rollup, optionally from ``since`` (a date) on"""
+    query = db.session.query(
+        func.coalesce(func.sum(DailySales.orders), 0),
+        func.coalesce(func.sum(DailySales.revenue), 0)
+    )
+    if since is not None:
+        query = query.filter(DailySales.date >= since)
+    return query.one()
+
 @dashboard_bp.route('/overview', methods=['GET'])
 @login_required
+@memoize_dashboard(ORDERS, CATALOG, USERS)
 def get_dashboard_overview():
     """Get dashboard overview with key metrics"""
     if not current_user.is_admin:
         return jsonify({'error': 'Admin access required'}), 403
     
-    # Calculate metrics
-    total_orders = Order.query.count()
-    total_revenue = db.session.query(func.sum(Order.total_amount)).scalar() or 0
+    # Calculate metrics; both totals come from the same rollup so they agree
+    total_orders, total_revenue = sales_totals()
     total_products = Product.query.count()
     total_customers = User.query.filter_by(is_admin=False).count()
     
     # Orders by status
-    orders_by_status = db.session.query(
-        Order.status, 
-        func.count(Order.id).label('count')
-    ).group_by(Order.status).all()
+    orders_by_status = status_counts()
     
     # Recent orders
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(5).all()
+    recent_orders = order_query().order_by(Order.created_at.desc()).limit(5).all()
     
     return jsonify({
         'total_orders': total_orders,
         'total_revenue': float(total_revenue),
         'total_products': total_products,
         'total_customers': total_customers,
-        'orders_by_status': {status: count for status, count in orders_by_status},
+        'orders_by_status': orders_by_status,
         'recent_orders': [order.to_dict() for order in recent_orders]
     }), 200
 
 @dashboard_bp.route('/revenue', methods=['GET'])
 @login_required
+@memoize_dashboard(ORDERS, period='month')
 def get_revenue_stats():
     """Get revenue statistics"""
     if not current_user.is_admin:
@@ -59,12 +95,10 @@ def get_revenue_stats():
         start_date = now - timedelta(days=365)
     
     revenue_data = db.session.query(
-        func.date(Order.created_at).label('date'),
-        func.sum(Order.total_amount).label('revenue'),
-        func.count(Order.id).label('orders')
-    ).filter(Order.created_at >= start_date).group_by(
-        func.date(Order.created_at)
-    ).all()
+        DailySales.date,
+        DailySales.revenue,
+        DailySales.orders
+    ).filter(DailySales.date >= start_date.date()).order_by(DailySales.date).all()
     
     return jsonify({
         'period': period,
@@ -80,6 +114,7 @@ def get_revenue_stats():
 
 @dashboard_bp.route('/top-products', methods=['GET'])
 @login_required
+@memoize_dashboard(ORDERS, CATALOG, limit=10)
 def get_top_products():
     """Get top selling products"""
     if not current_user.is_admin:
@@ -91,12 +126,12 @@ def get_top_products():
         Product.name,
         Product.id,
         Product.price,
-        func.sum(OrderItem.quantity).label('total_quantity'),
-        func.sum(OrderItem.quantity * OrderItem.unit_price).label('total_revenue')
-    ).join(OrderItem).group_by(
+        func.sum(DailyProductSales.quantity).label('total_quantity'),
+        func.sum(DailyProductSales.revenue).label('total_revenue')
+    ).join(DailyProductSales, DailyProductSales.product_id == Product.id).group_by(
         Product.id
     ).order_by(
-        func.sum(OrderItem.quantity).desc()
+        func.sum(DailyProductSales.quantity).desc()
     ).limit(limit).all()
     
     return jsonify({
@@ -114,6 +149,7 @@ def get_top_products():
 
 @dashboard_bp.route('/customer-stats', methods=['GET'])
 @login_required
+@memoize_dashboard(ORDERS, USERS)
 def get_customer_stats():
     """Get customer statistics"""
     if not current_user.is_admin:
@@ -128,16 +164,14 @@ def get_customer_stats():
         User.created_at >= month_start
     ).count()
     
-    # Top customers by spending
+    # Top customers by spending, read off the total_spent index
     top_customers = db.session.query(
         User.username,
         User.email,
-        func.count(Order.id).label('order_count'),
-        func.sum(Order.total_amount).label('total_spent')
-    ).join(Order).group_by(
-        User.id
-    ).order_by(
-        func.sum(Order.total_amount).desc()
+        CustomerSales.orders,
+        CustomerSales.total_spent
+    ).join(User, User.id == CustomerSales.user_id).order_by(
+        CustomerSales.total_spent.desc()
     ).limit(10).all()
     
     return jsonify({
@@ -156,6 +190,7 @@ def get_customer_stats():
 
 @dashboard_bp.route('/inventory', methods=['GET'])
 @login_required
+@memoize_dashboard(CATALOG, STOCK, threshold=5)
 def get_inventory_stats():
     """Get inventory status"""
     if not current_user.is_admin:
@@ -193,52 +228,53 @@ def get_inventory_stats():
 
 @dashboard_bp.route('/order-analytics', methods=['GET'])
 @login_required
+@memoize_dashboard(ORDERS)
 def get_order_analytics():
     """Get detailed order analytics"""
     if not current_user.is_admin:
         return jsonify({'error': 'Admin access required'}), 403
     
-    # Average order value
-    avg_order_value = db.session.query(
-        func.avg(Order.total_amount)
-    ).scalar() or 0
-    
     # Total orders by status
-    status_breakdown = db.session.query(
-        Order.status,
-        func.count(Order.id).label('count')
-    ).group_by(Order.status).all()
-    
-    # Orders this month
+    status_breakdown = status_counts()
     month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    orders_this_month = Order.query.filter(
-        Order.created_at >= month_start
-    ).count()
     
-    revenue_this_month = db.session.query(
-        func.sum(Order.total_amount)
-    ).filter(Order.created_at >= month_start).scalar() or 0
+    # Average order value
+    total_orders, total_revenue = sales_totals()
+    avg_order_value = total_revenue / total_orders if total_orders else 0
     
-    # Average order process time
-    completed_orders = Order.query.filter_by(status='delivered').all()
-    if completed_orders:
-        avg_time = sum(
-            (order.updated_at - order.created_at).total_seconds() 
-            for order in completed_orders
-        ) / len(completed_orders) / 86400  # Convert to days
-    else:
-        avg_time = 0
+    # Orders this month
+    orders_this_month, revenue_this_month = sales_totals(month_start.date())
+    
+    # Average time from checkout to delivery, in days
+    processing = transition_summary(PLACED, 'delivered')
+    avg_time = processing['mean'] / 86400 if processing else 0
+    
+    # Time spent in each fulfilment step, in hours
+    time_in_status = []
+    for from_status, to_status in FULFILMENT_TRANSITIONS:
+        summary = transition_summary(from_status, to_status)
+        if summary:
+            time_in_status.append({
+                'status': from_status,
+                'next_status': to_status,
+                'orders': summary['count'],
+                'p50_hours': round(summary[0.5] / 3600, 2),
+                'p90_hours': round(summary[0.9] / 3600, 2),
+                'p99_hours': round(summary[0.99] / 3600, 2)
+            })
     
     return jsonify({
         'average_order_value': float(avg_order_value),
-        'status_breakdown': {status: count for status, count in status_breakdown},
+        'status_breakdown': status_breakdown,
         'orders_this_month': orders_this_month,
         'revenue_this_month': float(revenue_this_month),
-        'average_processing_days': round(avg_time, 2)
+        'average_processing_days': round(avg_time, 2),
+        'time_in_status': time_in_status
     }), 200
 
 @dashboard_bp.route('/sales-trend', methods=['GET'])
 @login_required
+@memoize_dashboard(ORDERS, days=30)
 def get_sales_trend():
     """Get sales trend over time"""
     if not current_user.is_admin:
@@ -249,12 +285,10 @@ def get_sales_trend():
     start_date = datetime.utcnow() - timedelta(days=days)
     
     daily_sales = db.session.query(
-        func.date(Order.created_at).label('date'),
-        func.sum(Order.total_amount).label('revenue'),
-        func.count(Order.id).label('order_count')
-    ).filter(Order.created_at >= start_date).group_by(
-        func.date(Order.created_at)
-    ).order_by(func.date(Order.created_at)).all()
+        DailySales.date,
+        DailySales.revenue,
+        DailySales.orders
+    ).filter(DailySales.date >= start_date.date()).order_by(DailySales.date).all()
     
     return jsonify({
         'period_days': days,
@@ -270,18 +304,19 @@ def get_sales_trend():
 
 @dashboard_bp.route('/category-stats', methods=['GET'])
 @login_required
+@memoize_dashboard(ORDERS)
 def get_category_stats():
     """Get sales by category"""
     if not current_user.is_admin:
         return jsonify({'error': 'Admin access required'}), 403
     
     category_stats = db.session.query(
-        Product.category,
-        func.count(OrderItem.id).label('items_sold'),
-        func.sum(OrderItem.quantity * OrderItem.unit_price).label('revenue'),
-        func.avg(Product.price).label('avg_price')
-    ).join(OrderItem).join(Product).group_by(
-        Product.category
+        DailyCategorySales.category,
+        func.sum(DailyCategorySales.items_sold).label('items_sold'),
+        func.sum(DailyCategorySales.revenue).label('revenue'),
+        (func.sum(DailyCategorySales.price_total) / func.sum(DailyCategorySales.items_sold)).label('avg_price')
+    ).group_by(
+        DailyCategorySales.category
     ).all()
     
     return jsonify({
@@ -298,6 +333,7 @@ def get_category_stats():
 
 @dashboard_bp.route('/performance-summary', methods=['GET'])
 @login_required
+@memoize_dashboard(ORDERS)
 def get_performance_summary():
     """Get overall performance summary"""
     if not current_user.is_admin:
@@ -312,22 +348,19 @@ def get_performance_summary():
     last_month_end = month_start - timedelta(seconds=1)
     
     # Current month
-    current_revenue = db.session.query(func.sum(Order.total_amount)).filter(
-        Order.created_at >= month_start
-    ).scalar() or 0
-    
-    current_orders = Order.query.filter(Order.created_at >= month_start).count()
+    current_revenue, current_orders = db.session.query(
+        func.coalesce(func.sum(DailySales.revenue), 0),
+        func.coalesce(func.sum(DailySales.orders), 0)
+    ).filter(DailySales.date >= month_start.date()).one()
     
     # Last month
-    last_revenue = db.session.query(func.sum(Order.total_amount)).filter(
-        Order.created_at >= last_month_start,
-        Order.created_at <= last_month_end
-    ).scalar() or 0
-    
-    last_orders = Order.query.filter(
-        Order.created_at >= last_month_start,
-        Order.created_at <= last_month_end
-    ).count()
+    last_revenue, last_orders = db.session.query(
+        func.coalesce(func.sum(DailySales.revenue), 0),
+        func.coalesce(func.sum(DailySales.orders), 0)
+    ).filter(
+        DailySales.date >= last_month_start.date(),
+        DailySales.date <= last_month_end.date()
+    ).one()
     
     # Calculate growth
     revenue_growth = ((current_revenue - last_revenue) / last_revenue * 100) if last_revenue > 0 else 0
@@ -347,3 +380,86 @@ def get_performance_summary():
             'orders_percent': round(orders_growth, 2)
         }
     }), 200
+
+def run_widget(app, environ, widget, started):
+    """Run one dashboard route as a sub-request of a batch, in a pool thread
+
+    The sub-request gets its own app context, and so its own session and
+    database connection, and authenticates from the batch request's
+    cookies. Records its start time in ``started``. Returns (status, body).
+    """
+    started[widget] = time.monotonic()
+    environ = dict(environ, PATH_INFO=f'{dashboard_bp.url_prefix}/{widget}')
+    with app.request_context(environ):
+        response = app.full_dispatch_request()
+        return response.status_code, response.get_json()
+
+def wait_for_widgets(futures, started, timeout):
+    """Wait until every widget has finished or used up its own timeout
+
+    Each widget gets ``timeout`` seconds from when it starts running, and
+    at most ``timeout`` seconds queued behind other batches on the shared
+    pool. Returns {future: error} for the widgets given up on.
+    """
+    submitted = time.monotonic()
+    pending = set(futures)
+    errors = {}
+    while pending:
+        now = time.monotonic()
+        deadlines = []
+        for future in list(pending):
+            begin = started.get(futures[future])
+            if begin is None and now >= submitted + timeout and future.cancel():
+                errors[future] = {'error': 'No worker available', 'status': 503}
+            elif begin is not None and now >= begin + timeout:
+                # Already running, so it finishes in the background
+                errors[future] = {'error': 'Timed out', 'status': 504}
+            else:
+                deadlines.append((begin or submitted) + timeout)
+                continue
+            pending.discard(future)
+        if pending:
+            # A widget past its queue deadline that could not be cancelled has just started
+            done, _ = wait(pending, timeout=max(min(deadlines) - now, 0.01), return_when=FIRST_COMPLETED)
+            pending -= done
+    return errors
+
+@dashboard_bp.route('/batch', methods=['GET'])
+@login_required
+def get_dashboard_batch():
+    """Get several dashboard widgets in one request"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    widgets = list(dict.fromkeys(w.strip() for w in request.args.get('widgets', '').split(',') if w.strip()))
+    if not widgets:
+        return jsonify({'error': 'widgets is required', 'available': list(WIDGETS)}), 400
+    unknown = [w for w in widgets if w not in WIDGETS]
+    if unknown:
+        return jsonify({'error': f"Unknown widgets: {', '.join(unknown)}", 'available': list(WIDGETS)}), 400
+    
+    # Every widget sees the batch's other query args (period, days, limit, ...)
+    app = current_app._get_current_object()
+    pool = app.extensions['dashboard_pool']
+    started = {}
+    futures = {pool.submit(run_widget, app, request.environ, widget, started): widget for widget in widgets}
+    timed_out = wait_for_widgets(futures, started, current_app.config.get('DASHBOARD_WIDGET_TIMEOUT', 5.0))
+    
+    results = {}
+    errors = {}
+    for future, widget in futures.items():
+        if future in timed_out:
+            errors[widget] = timed_out[future]
+            continue
+        try:
+            status, body = future.result()
+        except Exception:
+            current_app.logger.exception('Dashboard widget %s failed', widget)
+            errors[widget] = {'error': 'Internal error', 'status': 500}
+            continue
+        if status == 200:
+            results[widget] = body
+        else:
+            errors[widget] = {'error': (body or {}).get('error', 'Failed'), 'status': status}
+    
+    return jsonify({'widgets': results, 'errors': errors}), 200
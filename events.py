@@ -0,0 +1,241 @@
+"""
+Publish/subscribe for order status changes and their Server-Sent Events streams
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from flask import current_app
+
+class Subscription:
+    """Bounded queue of messages for one subscriber
+
+    A subscriber that stops reading loses the oldest messages rather than
+    growing without bound.
+    """
+
+    def __init__(self, broker, channels, max_queued=100):
+        self.broker = broker
+        self.channels = channels
+        self.queue = queue.Queue(maxsize=max_queued)
+
+    def deliver(self, channel, message):
+        while True:
+            try:
+                self.queue.put_nowait((channel, message))
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout):
+        """Next (channel, message), or None after ``timeout`` seconds"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+class LocalBroker:
+    """Delivers messages to subscribers in this process only"""
+
+    def __init__(self):
+        self.subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels, max_queued=100):
+        subscription = Subscription(self, channels, max_queued)
+        with self._lock:
+            for channel in channels:
+                self.subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self.subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscribers[channel]
+
+    def publish(self, channel, message):
+        self.dispatch(channel, message)
+
+    def dispatch(self, channel, message):
+        with self._lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(channel, message)
+
+class SQLiteBroker(LocalBroker):
+    """Shares messages between worker processes through a small SQLite file
+
+    Publishing appends a row; one thread per process polls for rows newer
+    than the last one it saw and hands them to local subscribers. Rows are
+    pruned after ``retention`` seconds. It stands in for a real broker
+    (Redis, NATS) on a single host.
+    """
+
+    def __init__(self, path, poll_interval=0.25, retention=60):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        # sqlite3's own context manager only commits; closing() closes the file
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    channel TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self.last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+        threading.Thread(target=self._poll, name='event-broker', daemon=True).start()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def publish(self, channel, message):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'INSERT INTO events (channel, message, created_at) VALUES (?, ?, ?)',
+                (channel, json.dumps(message), time.time())
+            )
+
+    def _poll(self):
+        conn = self._connect()
+        last_prune = time.monotonic()
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                rows = conn.execute(
+                    'SELECT id, channel, message FROM events WHERE id > ? ORDER BY id', (self.last_id,)
+                ).fetchall()
+                for event_id, channel, message in rows:
+                    self.last_id = event_id
+                    self.dispatch(channel, json.loads(message))
+                if time.monotonic() - last_prune > self.retention:
+                    last_prune = time.monotonic()
+                    with conn:
+                        conn.execute('DELETE FROM events WHERE created_at < ?', (time.time() - self.retention,))
+            except sqlite3.Error:
+                continue
+
+def create_broker(config):
+    """Broker for EVENTS_BACKEND: 'local' or 'sqlite' (at EVENTS_DB_PATH)"""
+    backend = config.get('EVENTS_BACKEND', 'local')
+    if backend == 'local':
+        return LocalBroker()
+    if backend == 'sqlite':
+        return SQLiteBroker(config.get('EVENTS_DB_PATH') or os.path.abspath('toady-events.db'))
+    raise ValueError(f'Unknown events backend: {backend}')
+
+class StreamLimiter:
+    """Caps open event streams per process and per user"""
+
+    def __init__(self, max_streams=100, max_per_user=3):
+        self.max_streams = max_streams
+        self.max_per_user = max_per_user
+        self.open = {}
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, user_id):
+        with self._lock:
+            if self.total >= self.max_streams or self.open.get(user_id, 0) >= self.max_per_user:
+                return False
+            self.total += 1
+            self.open[user_id] = self.open.get(user_id, 0) + 1
+            return True
+
+    def release(self, user_id):
+        with self._lock:
+            self.total -= 1
+            self.open[user_id] -= 1
+            if not self.open[user_id]:
+                del self.open[user_id]
+
+def order_channels(order):
+    return [f'order:{order.id}', f'user:{order.user_id}']
+
+def status_message(order):
+    return {
+        'order_id': order.id,
+        'status': order.status,
+        'updated_at': order.updated_at.isoformat()
+    }
+
+def publish_order_status(order):
+    """Announce an order's committed status to its order and user channels"""
+    broker = current_app.extensions['event_broker']
+    message = status_message(order)
+    for channel in order_channels(order):
+        broker.publish(channel, message)
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+def event_stream(subscription, initial=(), heartbeat=15, max_duration=300):
+    """Yield SSE frames until the client disconnects or ``max_duration`` passes
+
+    A comment line goes out every ``heartbeat`` seconds without events so
+    proxies keep the connection open. Ending the stream after
+    ``max_duration`` makes EventSource reconnect, which frees the thread
+    and re-checks the session.
+    """
+    yield f'retry: {heartbeat * 1000}\n\n'
+    for message in initial:
+        yield format_event('status', message)
+    deadline = time.monotonic() + max_duration
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        item = subscription.get(min(heartbeat, remaining))
+        if item is None:
+            yield ': keepalive\n\n'
+        else:
+            yield format_event('status', item[1])
+
+def stream_response(channels, user_id, snapshot=None):
+    """text/event-stream response for ``channels``, or None at the stream limit
+
+    ``snapshot`` returns the current state as a list of messages. It runs
+    after subscribing, so no change between the two can be missed.
+    """
+    config = current_app.config
+    limiter = current_app.extensions['event_streams']
+    if not limiter.acquire(user_id):
+        return None
+    subscription = current_app.extensions['event_broker'].subscribe(channels)
+    
+    def close():
+        subscription.close()
+        limiter.release(user_id)
+    
+    try:
+        initial = snapshot() if snapshot else []
+    except Exception:
+        close()
+        raise
+    
+    response = current_app.response_class(
+        event_stream(subscription, initial, config.get('SSE_HEARTBEAT', 15), config.get('SSE_MAX_DURATION', 300)),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # Runs when the server closes the response, even if it was never iterated
+    response.call_on_close(close)
+    return response
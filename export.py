@@ -0,0 +1,96 @@
+"""
+Streaming export of orders with their items
+"""
+import csv
+import io
+import json
+from itertools import groupby
+from sqlalchemy import select
+from .models import db, Order, OrderItem, Product
+
+CSV_COLUMNS = [
+    'order_id', 'user_id', 'status', 'total_amount', 'delivery_date',
+    'special_instructions', 'created_at', 'updated_at',
+    'item_id', 'product_id', 'product_name', 'quantity', 'unit_price', 'total_price'
+]
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+def export_statement():
+    """Flat select of orders joined to their items and product names"""
+    return select(
+        Order.id, Order.user_id, Order.status, Order.total_amount, Order.delivery_date,
+        Order.special_instructions, Order.created_at, Order.updated_at,
+        OrderItem.id, OrderItem.product_id, Product.name, OrderItem.quantity, OrderItem.unit_price
+    ).outerjoin(OrderItem, OrderItem.order_id == Order.id).outerjoin(
+        Product, Product.id == OrderItem.product_id
+    ).order_by(Order.id, OrderItem.id)
+
+def export_rows(stmt, batch_size=1000):
+    """Yield one flat row per order item, ordered by order id
+
+    Rows are fetched from a server-side cursor in batches of ``batch_size``
+    so memory stays flat regardless of how many orders are exported.
+    """
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    try:
+        yield from result
+    finally:
+        result.close()
+
+def _order_dict(rows):
+    first = rows[0]
+    return {
+        'id': first[0],
+        'user_id': first[1],
+        'total_amount': first[3],
+        'status': first[2],
+        'delivery_date': _isoformat(first[4]),
+        'special_instructions': first[5],
+        'items': [
+            {
+                'id': row[8],
+                'product_id': row[9],
+                'product_name': row[10],
+                'quantity': row[11],
+                'unit_price': row[12],
+                'total_price': row[11] * row[12]
+            }
+            for row in rows if row[8] is not None
+        ],
+        'created_at': _isoformat(first[6]),
+        'updated_at': _isoformat(first[7])
+    }
+
+def generate_ndjson(rows):
+    """Yield one JSON line per order, shaped like Order.to_dict()"""
+    for _, order_rows in groupby(rows, key=lambda row: row[0]):
+        yield json.dumps(_order_dict(list(order_rows))) + '\n'
+
+def generate_csv(rows, chunk_size=65536):
+    """Yield CSV text with one line per order item, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+
+    for row in rows:
+        quantity, unit_price = row[11], row[12]
+        total_price = quantity * unit_price if quantity is not None else None
+        writer.writerow([
+            row[0], row[1], row[2], row[3], _isoformat(row[4]), row[5],
+            _isoformat(row[6]), _isoformat(row[7]),
+            row[8], row[9], row[10], quantity, unit_price, total_price
+        ])
+        if buffer.tell() >= chunk_size:
+            yield flush()
+
+    yield flush()
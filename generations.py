@@ -0,0 +1,48 @@
+"""
+Database-backed generation counters for cache invalidation
+"""
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from .models import db, Generation
+
+# Bumped by every write to the orders (and rollup) tables and the users table;
+# product writes bump catalog.CATALOG, checkout's stock changes catalog.STOCK
+ORDERS = 'orders'
+USERS = 'users'
+
+# Counters are read from the main database, even in requests routed to the
+# analytics copy, so a write invalidates caches as soon as it commits
+def get_generation(name):
+    """Current generation of a data set (0 if it was never bumped)"""
+    return db.session.scalar(
+        select(Generation.value).where(Generation.name == name),
+        bind_arguments={'bind': db.engine}
+    ) or 0
+
+def get_generations(names, routed=False):
+    """Current generations of several data sets, in order, with one query
+
+    With ``routed`` the counters are read wherever the request's other
+    queries go, so in a request routed to the analytics copy they describe
+    the copy's data rather than the main database's.
+    """
+    kwargs = {} if routed else {'bind_arguments': {'bind': db.engine}}
+    values = dict(db.session.execute(
+        select(Generation.name, Generation.value).where(Generation.name.in_(names)),
+        **kwargs
+    ).all())
+    return tuple(values.get(name, 0) for name in names)
+
+def bump_generation(name):
+    """Increment a generation inside the caller's transaction
+
+    Because the counter lives in the database and is committed together with
+    the write that changed the data, every worker process sees the new value
+    as soon as the change itself is visible.
+    """
+    stmt = insert(Generation).values(name=name, value=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Generation.name],
+        set_={'value': Generation.value + 1}
+    )
+    db.session.execute(stmt)
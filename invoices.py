@@ -0,0 +1,316 @@
+"""
+Printable invoice rendering with a content-addressed file cache
+"""
+import hashlib
+import multiprocessing
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.orm import joinedload, selectinload
+from werkzeug.datastructures import MultiDict
+from jinja2 import Environment
+from markupsafe import Markup
+from .models import Order, OrderItem
+from .pagination import filter_orders
+
+# Bump when the template changes so cached invoices are re-rendered
+TEMPLATE_VERSION = 1
+
+CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'invoice.css')
+
+TEMPLATE = Environment(autoescape=True).from_string("""<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="utf-8">
+  <title>Invoice #{{ order.id }}</title>
+  <style>{{ css }}</style>
+</head>
+<body>
+  <div class="invoice-box">
+    <table cellpadding="0" cellspacing="0">
+      <tr class="top">
+        <td colspan="2">
+          <table>
+            <tr>
+              <td class="title">TOADY BAKERY</td>
+              <td>
+                Invoice #: {{ order.id }}<br>
+                Created: {{ order.created_at[:10] }}<br>
+                {% if order.delivery_date %}Delivery: {{ order.delivery_date[:10] }}<br>{% endif %}
+              </td>
+            </tr>
+          </table>
+        </td>
+      </tr>
+      <tr class="information">
+        <td colspan="2">
+          <table>
+            <tr>
+              <td>
+                Toady Bakery<br>
+                123 Bakers Street
+              </td>
+              <td>
+                {{ customer.name }}<br>
+                {{ customer.email }}<br>
+                {% if customer.phone %}Phone: {{ customer.phone }}<br>{% endif %}
+                {% if customer.address %}Address: {{ customer.address }}{% endif %}
+              </td>
+            </tr>
+          </table>
+        </td>
+      </tr>
+      <tr class="heading">
+        <td>Status</td>
+        <td>{{ order.status|capitalize }}</td>
+      </tr>
+      <tr class="details">
+        <td>{{ order.special_instructions or '' }}</td>
+        <td></td>
+      </tr>
+      <tr class="heading">
+        <td>Item</td>
+        <td>Price</td>
+      </tr>
+      {% for item in order['items'] %}
+      <tr class="item{% if loop.last %} last{% endif %}">
+        <td>{{ item.product_name }} (x{{ item.quantity }} @ {{ '%.2f'|format(item.unit_price) }})</td>
+        <td>{{ '%.2f'|format(item.total_price) }}</td>
+      </tr>
+      {% endfor %}
+      <tr class="total">
+        <td></td>
+        <td>Total: {{ '%.2f'|format(order.total_amount) }}</td>
+      </tr>
+    </table>
+  </div>
+</body>
+</html>
+""")
+
+_css = None
+
+def invoice_css():
+    global _css
+    if _css is None:
+        with open(CSS_PATH, encoding='utf-8') as f:
+            _css = f.read()
+    return _css
+
+def invoice_context(order):
+    """Everything an invoice shows, as plain data that can go to another process"""
+    user = order.user
+    name = ' '.join(part for part in (user.first_name, user.last_name) if part) or user.username
+    return {
+        'order': order.to_dict(),
+        'customer': {'name': name, 'email': user.email, 'phone': user.phone, 'address': user.address}
+    }
+
+def invoice_key(context):
+    """Content hash of an invoice; changes whenever anything it shows changes
+
+    The order dict includes ``updated_at``, and the template version and
+    stylesheet are hashed in so restyling invalidates old renders.
+    """
+    digest = hashlib.sha256()
+    digest.update(f'{TEMPLATE_VERSION}:'.encode())
+    digest.update(invoice_css().encode())
+    digest.update(json.dumps(context, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def render_invoice(context):
+    """Render invoice HTML; pure, so it can run in a worker process"""
+    return TEMPLATE.render(css=Markup(invoice_css()), **context).encode('utf-8')
+
+class InvoiceCache:
+    """Rendered invoices on disk, named by content hash and evicted by total size
+
+    Files are written atomically, so several worker processes can share a
+    directory. Reads refresh a file's mtime, and eviction removes the least
+    recently used files until the total is back under 90% of ``max_bytes``.
+    Other processes' writes are not counted in ``size``, so the directory
+    is re-measured every ``rescan_interval`` seconds and before evicting.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, rescan_interval=10.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rescan_interval = rescan_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.rescan()
+
+    def rescan(self):
+        """Measure the directory, including files other processes wrote"""
+        self.size = sum(size for _, size, _ in self._files())
+        self._scanned_at = time.monotonic()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.html')
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.html'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return body
+
+    def put(self, key, body):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+        os.replace(tmp, path)
+        with self._lock:
+            self.size += len(body)
+            if self.size > self.max_bytes or time.monotonic() - self._scanned_at > self.rescan_interval:
+                self.rescan()
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Remove least recently used invoices until under the size budget"""
+        files = sorted(self._files(), key=lambda file: file[2])
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self.size = total
+
+def invoice_cache():
+    """The app's InvoiceCache"""
+    return current_app.extensions['invoice_cache']
+
+def create_invoice_cache(app):
+    return InvoiceCache(
+        app.config.get('INVOICE_CACHE_DIR') or os.path.join(app.instance_path, 'invoices'),
+        app.config.get('INVOICE_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+    )
+
+def cached_invoice(order):
+    """Return (key, html) for an order, rendering only on a cache miss"""
+    cache = invoice_cache()
+    context = invoice_context(order)
+    key = invoice_key(context)
+    body = cache.get(key)
+    if body is None:
+        body = render_invoice(context)
+        cache.put(key, body)
+    return key, body
+
+def create_invoice_pool(config):
+    """Process pool for rendering invoice archives, kept for the app's lifetime
+
+    Worker processes are only started by the first archive request. They are
+    spawned rather than forked so they never inherit the server's threads,
+    locks or open database connections.
+    """
+    return ProcessPoolExecutor(max_workers=config.get('INVOICE_WORKERS') or os.cpu_count(),
+                               mp_context=multiprocessing.get_context('spawn'))
+
+def write_archive(orders, fileobj, pool, chunk_size=200):
+    """Write invoices for ``orders`` into a zip, rendering misses in ``pool``
+
+    ``orders`` is an iterable of Order objects; they are handled
+    ``chunk_size`` at a time so memory stays bounded. Returns the number of
+    invoices written.
+    """
+    cache = invoice_cache()
+    count = 0
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as archive:
+        chunk = []
+        for order in orders:
+            chunk.append(order)
+            if len(chunk) >= chunk_size:
+                count += _archive_chunk(chunk, cache, pool, archive)
+                chunk = []
+        if chunk:
+            count += _archive_chunk(chunk, cache, pool, archive)
+    return count
+
+def _archive_chunk(orders, cache, pool, archive):
+    entries = []
+    for order in orders:
+        context = invoice_context(order)
+        key = invoice_key(context)
+        entries.append((order.id, context, key, cache.get(key)))
+
+    missing = [entry for entry in entries if entry[3] is None]
+    rendered = pool.map(render_invoice, [entry[1] for entry in missing], chunksize=16)
+    bodies = {}
+    for (order_id, _, key, _), body in zip(missing, rendered):
+        cache.put(key, body)
+        bodies[order_id] = body
+
+    for order_id, _, _, body in entries:
+        archive.writestr(f'invoice-{order_id}.html', body or bodies[order_id])
+    return len(entries)
+
+def check_archive_range(args, max_days):
+    """Require a ``date_from``/``date_to`` range of at most ``max_days``; raises ValueError"""
+    if not args.get('date_from') or not args.get('date_to'):
+        raise ValueError('date_from and date_to are required')
+    days = (datetime.fromisoformat(args['date_to']) - datetime.fromisoformat(args['date_from'])).total_seconds() / 86400
+    if days <= 0:
+        raise ValueError('date_to must be after date_from')
+    if days > max_days:
+        raise ValueError(f'At most {max_days} days per archive; use the render-invoices command for longer ranges')
+
+def archive_query(args):
+    """Orders matching ``date_from``/``date_to``/``status`` args, oldest first, in batches"""
+    # invoice_context reads the items, products and customer of every order.
+    # yield_per cannot be combined with joined loading of a collection, so the
+    # items are always selectin-loaded here, whatever ORDER_LOADING_STRATEGY says
+    query = Order.query.options(
+        selectinload(Order.items).selectinload(OrderItem.product),
+        joinedload(Order.user),
+    )
+    return filter_orders(query, args).order_by(Order.id).yield_per(200)
+
+@click.command('render-invoices')
+@click.option('--date-from', help='first order date (YYYY-MM-DD)')
+@click.option('--date-to', help='day after the last order date (YYYY-MM-DD)')
+@click.option('--output', default='invoices.zip', show_default=True)
+@click.option('--workers', type=int, help='rendering processes (default: CPU count)')
+@with_appcontext
+def render_invoices_command(date_from, date_to, output, workers):
+    """Render invoices for a date range of orders into one zip archive"""
+    args = MultiDict({k: v for k, v in (('date_from', date_from), ('date_to', date_to)) if v})
+    workers = workers or current_app.config.get('INVOICE_WORKERS') or os.cpu_count()
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    with pool, open(output, 'wb') as f:
+        count = write_archive(archive_query(args), f, pool)
+    click.echo(f'Wrote {count} invoices to {output}')
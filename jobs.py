@@ -0,0 +1,204 @@
+"""
+Durable SQLite-backed job queue and the worker pool that drains it
+"""
+import json
+import os
+import random
+import signal
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, delete, func, or_, and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .models import db, Job
+
+HANDLERS = {}
+
+def job_handler(kind):
+    """Register a function as the handler for jobs of ``kind``
+
+    Handlers receive the decoded payload and run in an app context. A job
+    can run more than once (a failed attempt, or a worker that died
+    mid-job), so handlers must be safe to repeat.
+    """
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+def enqueue(kind, payload, key=None, delay=0, max_attempts=None):
+    """Add a job to the current transaction; workers only see it once committed
+
+    If ``key`` is given and a job with that key already exists, nothing is
+    added.
+    """
+    now = datetime.utcnow()
+    stmt = sqlite_insert(Job).values(
+        kind=kind,
+        payload=json.dumps(payload),
+        key=key,
+        status='pending',
+        attempts=0,
+        max_attempts=max_attempts or current_app.config.get('JOBS_MAX_ATTEMPTS', 5),
+        run_at=now + timedelta(seconds=delay),
+        created_at=now,
+        updated_at=now
+    )
+    if key is not None:
+        stmt = stmt.on_conflict_do_nothing(index_elements=['key'])
+    db.session.execute(stmt)
+
+def claim(worker_id, lease):
+    """Atomically take the oldest due job, or None
+
+    Jobs left running longer than ``lease`` seconds belong to a worker that
+    died and are taken over.
+    """
+    now = datetime.utcnow()
+    due = select(Job.id).where(or_(
+        and_(Job.status == 'pending', Job.run_at <= now),
+        and_(Job.status == 'running', Job.locked_at < now - timedelta(seconds=lease))
+    )).order_by(Job.run_at, Job.id).limit(1).scalar_subquery()
+    job = db.session.execute(
+        update(Job).where(Job.id == due).values(
+            status='running', locked_by=worker_id, locked_at=now,
+            attempts=Job.attempts + 1, updated_at=now
+        ).returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts),
+        execution_options={'synchronize_session': False}
+    ).first()
+    db.session.commit()
+    return job
+
+def retry_delay(attempts, base, cap):
+    """Exponential backoff with jitter, so failing jobs do not retry in lockstep"""
+    delay = min(cap, base * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+def finish(job_id, worker_id, **values):
+    """Record a job's outcome if ``worker_id`` still holds it
+
+    Returns False when the lease expired and another worker took the job
+    over, in which case that worker's outcome is the one that counts.
+    """
+    result = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.locked_by == worker_id).values(
+            locked_by=None, locked_at=None, updated_at=datetime.utcnow(), **values
+        ),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    if result.rowcount == 0:
+        current_app.logger.warning('Job %s was taken over by another worker; dropping outcome from %s',
+                                   job_id, worker_id)
+        return False
+    return True
+
+def run_job(job, worker_id):
+    """Run a job claimed by ``worker_id`` and record its outcome"""
+    config = current_app.config
+    handler = HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler for job kind {job.kind}')
+        handler(json.loads(job.payload))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception('Job %s (%s) failed on attempt %s', job.id, job.kind, job.attempts)
+        error = f'{type(e).__name__}: {e}'
+        if handler is None or job.attempts >= job.max_attempts:
+            finish(job.id, worker_id, status='failed', last_error=error)
+        else:
+            delay = retry_delay(job.attempts, config.get('JOBS_BACKOFF_BASE', 5), config.get('JOBS_BACKOFF_MAX', 3600))
+            finish(job.id, worker_id, status='pending', last_error=error,
+                   run_at=datetime.utcnow() + timedelta(seconds=delay))
+        return False
+    return finish(job.id, worker_id, status='done', last_error=None)
+
+def prune_jobs(days):
+    """Delete finished jobs older than ``days``; failed jobs are kept for inspection"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    result = db.session.execute(delete(Job).where(Job.status == 'done', Job.updated_at < cutoff))
+    db.session.commit()
+    return result.rowcount
+
+def queue_stats():
+    """Job counts by status and the lag of the oldest due pending job"""
+    now = datetime.utcnow()
+    counts = dict(db.session.query(Job.status, func.count()).group_by(Job.status).all())
+    oldest = db.session.query(func.min(Job.run_at)).filter(
+        Job.status == 'pending', Job.run_at <= now
+    ).scalar()
+    return {
+        'pending': counts.get('pending', 0),
+        'running': counts.get('running', 0),
+        'failed': counts.get('failed', 0),
+        'done': counts.get('done', 0),
+        'lag_seconds': (now - oldest).total_seconds() if oldest else 0.0
+    }
+
+def queue_gauges():
+    """queue_stats as Prometheus gauges for the metrics endpoint"""
+    stats = queue_stats()
+    return [
+        ('job_queue_depth', 'Jobs in the queue by status',
+         [({'status': status}, stats[status]) for status in ('pending', 'running', 'failed')]),
+        ('job_queue_lag_seconds', 'How long the oldest due job has been waiting',
+         [({}, stats['lag_seconds'])]),
+    ]
+
+class Worker:
+    """Pool of threads that claim and run jobs until stopped"""
+
+    def __init__(self, app, concurrency=None, poll_interval=None):
+        self.app = app
+        self.concurrency = concurrency or app.config.get('JOBS_WORKERS', 2)
+        self.poll_interval = poll_interval or app.config.get('JOBS_POLL_INTERVAL', 1.0)
+        self.stopping = threading.Event()
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+
+    def run_once(self, worker_id):
+        """Claim and run one job; False if none was due"""
+        job = claim(worker_id, self.app.config.get('JOBS_LEASE_SECONDS', 300))
+        if job is None:
+            return False
+        run_job(job, worker_id)
+        return True
+
+    def _loop(self, n):
+        worker_id = f'{self.name}:{n}'
+        last_prune = 0.0
+        failures = 0
+        while not self.stopping.is_set():
+            with self.app.app_context():
+                try:
+                    if n == 0 and time.monotonic() - last_prune > 3600:
+                        last_prune = time.monotonic()
+                        prune_jobs(self.app.config.get('JOBS_RETENTION_DAYS', 7))
+                    ran = self.run_once(worker_id)
+                except Exception:
+                    # e.g. "database is locked" under write contention; keep the thread alive
+                    db.session.rollback()
+                    failures += 1
+                    self.app.logger.exception('Job worker %s failed (%s in a row)', worker_id, failures)
+                    self.stopping.wait(min(self.poll_interval * 2 ** failures, 60))
+                    continue
+            failures = 0
+            if not ran:
+                self.stopping.wait(self.poll_interval)
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def run(self):
+        """Run until SIGINT/SIGTERM; jobs in progress are allowed to finish"""
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        threads = [threading.Thread(target=self._loop, args=(n,), name=f'job-worker-{n}')
+                   for n in range(self.concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
@@ -0,0 +1,31 @@
+"""
+Relationship loading strategies for order queries
+"""
+from flask import current_app, request
+from sqlalchemy.orm import selectinload, joinedload
+from .models import Order, OrderItem
+
+LOADING_STRATEGIES = ('selectin', 'joined', 'lazy')
+
+def order_load_options(strategy='selectin'):
+    """Build loader options for Order.items and OrderItem.product"""
+    if strategy == 'selectin':
+        # One extra query for all items, one for all their products
+        return [selectinload(Order.items).selectinload(OrderItem.product)]
+    if strategy == 'joined':
+        # Everything in a single LEFT OUTER JOIN
+        return [joinedload(Order.items).joinedload(OrderItem.product)]
+    if strategy == 'lazy':
+        return []
+    raise ValueError(f'Unknown loading strategy: {strategy}')
+
+def strategy_for(endpoint=None):
+    """Resolve the configured loading strategy for an endpoint"""
+    if endpoint is None and request:
+        endpoint = request.endpoint
+    overrides = current_app.config.get('ORDER_LOADING_OVERRIDES', {})
+    return overrides.get(endpoint, current_app.config.get('ORDER_LOADING_STRATEGY', 'selectin'))
+
+def order_query(endpoint=None):
+    """Order query with items and products eagerly loaded for the endpoint"""
+    return Order.query.options(*order_load_options(strategy_for(endpoint)))
@@ -0,0 +1,110 @@
+"""
+Short-lived in-process memoization of dashboard responses
+"""
+import functools
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request
+from flask_login import current_user
+from .generations import get_generations
+
+class ResponseMemo:
+    """Bounded LRU of response bodies, each valid for one set of table generations
+
+    Entries also expire ``ttl`` seconds after they were computed, which
+    bounds how stale time-windowed figures ("this month", "last 7 days")
+    can get. Only one thread computes a missing or expired entry; other
+    requests for the same key wait for it instead of running the same
+    aggregation.
+    """
+
+    def __init__(self, max_entries=256, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._computing = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, generations, compute):
+        """Cached body for ``key`` at ``generations``, or the result of compute()
+
+        ``compute`` returns (body, cacheable); only cacheable bodies are kept.
+        """
+        while True:
+            with self._lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] > time.monotonic() and entry[1] == generations:
+                    self.hits += 1
+                    self.entries.move_to_end(key)
+                    return entry[2]
+                computing = self._computing.get(key)
+                if computing is None:
+                    computing = self._computing[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Someone else is computing this key; use their result if it fits
+            computing.wait()
+        
+        try:
+            body, cacheable = compute()
+            if cacheable:
+                with self._lock:
+                    self.entries[key] = (time.monotonic() + self.ttl, generations, body)
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+            return body
+        finally:
+            with self._lock:
+                self._computing.pop(key).set()
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+def memoize_dashboard(*tables, **args):
+    """Serve an admin dashboard handler's successful JSON responses from a ResponseMemo
+
+    ``tables`` are the generation names of the data the handler reads; a
+    write that bumps any of them invalidates the cached responses. Entries
+    are keyed on the endpoint and the query arguments named in ``args``
+    (mapped to their defaults), parsed the way the handler parses them, so
+    ``?limit=10``, ``?limit=x`` and no limit at all share an entry. Apply
+    below ``login_required``.
+
+    The generations are read from the same database as the handler's
+    queries. In a request routed to the analytics copy they are the copy's
+    generations, so a response computed from a copy that is behind the main
+    database is cached under the copy's state and recomputed once the next
+    copy brings in the write.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*view_args, **view_kwargs):
+            memo = current_app.extensions.get('dashboard_memo')
+            # Non-admins get the handler's own 403
+            if memo is None or not current_user.is_admin:
+                return view(*view_args, **view_kwargs)
+            
+            key = (request.endpoint,) + tuple(
+                request.args.get(name, default, type=type(default)) for name, default in sorted(args.items())
+            )
+            
+            def compute():
+                response = current_app.make_response(view(*view_args, **view_kwargs))
+                return (response.status_code, response.get_data()), response.status_code == 200
+            
+            status, body = memo.get_or_compute(key, get_generations(tables, routed=True), compute)
+            return current_app.response_class(body, status=status, mimetype='application/json')
+        return wrapper
+    return decorator
+
+def create_dashboard_memo(config):
+    """ResponseMemo for the dashboard, or None if DASHBOARD_CACHE_TTL is 0"""
+    ttl = config.get('DASHBOARD_CACHE_TTL', 30)
+    if not ttl:
+        return None
+    return ResponseMemo(config.get('DASHBOARD_CACHE_SIZE', 256), ttl)
@@ -0,0 +1,244 @@
+"""
+Request latency and SQL metrics in Prometheus text format
+"""
+import atexit
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+# Upper bounds in seconds; +Inf is implied
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metrics:
+    """Per-process metric store, optionally shared with other workers via files
+
+    Recording a request is a bisect and a few list increments under one
+    lock. When ``directory`` is set, every worker periodically writes its
+    totals to ``<directory>/metrics-<pid>.json`` and a scrape of any worker
+    sums all of those files, so the output covers the whole worker pool.
+    A worker removes its file when it exits, and files left behind by
+    workers that died are removed by the next scrape.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        # (endpoint, method, status) -> [bucket counts..., sum, count]
+        self.requests = {}
+        # endpoint -> [queries, seconds]
+        self.sql = {}
+        self.collectors = []
+        # Read at scrape time and not merged across workers, for values that
+        # are the same everywhere (e.g. read from the database)
+        self.gauges = []
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.remove)
+
+    def observe_request(self, endpoint, method, status, seconds, queries, sql_seconds):
+        key = (endpoint, method, str(status))
+        with self._lock:
+            series = self.requests.get(key)
+            if series is None:
+                series = self.requests[key] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+            series[bisect.bisect_left(BUCKETS, seconds)] += 1
+            series[-2] += seconds
+            series[-1] += 1
+            sql = self.sql.setdefault(endpoint, [0, 0.0])
+            sql[0] += queries
+            sql[1] += sql_seconds
+            # Claim the flush under the lock so only one request thread does it
+            due = self.directory and time.monotonic() - self._last_flush > self.flush_interval
+            if due:
+                self._last_flush = time.monotonic()
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        """JSON-serializable copy of this process's totals"""
+        with self._lock:
+            data = {
+                'requests': [list(key) + series for key, series in self.requests.items()],
+                'sql': [[endpoint] + values for endpoint, values in self.sql.items()],
+            }
+        data['counters'] = [list(item) for collect in self.collectors for item in collect()]
+        return data
+
+    def flush(self):
+        """Write this process's snapshot for other workers to read"""
+        with self._lock:
+            self._last_flush = time.monotonic()
+        path = self._path(os.getpid())
+        with self._flush_lock:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+
+    def remove(self):
+        """Delete this process's file so exited workers drop out of the totals"""
+        with self._flush_lock:
+            try:
+                os.remove(self._path(os.getpid()))
+            except FileNotFoundError:
+                pass
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'metrics-{pid}.json')
+
+    def collect(self):
+        """Totals summed over every worker (or just this one without a directory)"""
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        merged = {'requests': {}, 'sql': {}, 'counters': {}}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            pid = _file_pid(path)
+            if pid is not None and not _pid_alive(pid):
+                # Killed before its atexit hook ran
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for row in data['requests']:
+                _add(merged['requests'], tuple(row[:3]), row[3:])
+            for row in data['sql']:
+                _add(merged['sql'], row[0], row[1:])
+            for row in data['counters']:
+                _add(merged['counters'], tuple(row[:-1]), row[-1:])
+        return {
+            'requests': [list(key) + values for key, values in merged['requests'].items()],
+            'sql': [[key] + values for key, values in merged['sql'].items()],
+            'counters': [list(key) + values for key, values in merged['counters'].items()],
+        }
+
+    def render(self):
+        """Prometheus text exposition format"""
+        data = self.collect()
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by endpoint, method and status',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for row in sorted(data['requests']):
+            endpoint, method, status = row[:3]
+            buckets, total, count = row[3:3 + len(BUCKETS) + 1], row[-2], row[-1]
+            labels = f'endpoint="{endpoint}",method="{method}",status="{status}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ('+Inf',), buckets):
+                cumulative += n
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {total}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {count}')
+
+        lines += [
+            '# HELP http_request_sql_queries_total SQL statements executed while serving requests',
+            '# TYPE http_request_sql_queries_total counter',
+        ]
+        lines += [f'http_request_sql_queries_total{{endpoint="{e}"}} {q}' for e, q, _ in sorted(data['sql'])]
+        lines += [
+            '# HELP http_request_sql_seconds_total Time spent in SQL statements while serving requests',
+            '# TYPE http_request_sql_seconds_total counter',
+        ]
+        lines += [f'http_request_sql_seconds_total{{endpoint="{e}"}} {s}' for e, _, s in sorted(data['sql'])]
+
+        if data['counters']:
+            lines += [
+                '# HELP cache_requests_total In-process cache lookups by cache and result',
+                '# TYPE cache_requests_total counter',
+            ]
+            lines += [f'cache_requests_total{{cache="{c}",result="{r}"}} {v}' for c, r, v in sorted(data['counters'])]
+
+        for gauge in self.gauges:
+            for name, help_text, samples in gauge():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+                for labels, value in samples:
+                    label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                    lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+def _file_pid(path):
+    """Worker pid from a metrics-<pid>.json file name, or None"""
+    try:
+        return int(os.path.basename(path)[len('metrics-'):-len('.json')])
+    except ValueError:
+        return None
+
+def _pid_alive(pid):
+    """True if a process with ``pid`` exists on this host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _add(target, key, values):
+    current = target.get(key)
+    target[key] = list(values) if current is None else [a + b for a, b in zip(current, values)]
+
+def cache_collector(name, cache):
+    """Report a cache's hit/miss counters as cache_requests_total"""
+    return lambda: [(name, 'hit', cache.hits), (name, 'miss', cache.misses)]
+
+def instrument_engine(engine):
+    """Count statements and their time against the current request"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        if has_request_context():
+            g.sql_queries = g.get('sql_queries', 0) + 1
+            g.sql_seconds = g.get('sql_seconds', 0.0) + elapsed
+
+    @event.listens_for(engine, 'handle_error')
+    def failed_query(context):
+        # A failed statement never reaches after_cursor_execute
+        conn = context.connection
+        starts = conn.info.get('query_start') if conn is not None else None
+        if starts:
+            starts.pop()
+
+def init_metrics(app, engine):
+    """Attach request timing hooks and engine instrumentation to the app"""
+    metrics = Metrics(app.config.get('METRICS_DIR'), app.config.get('METRICS_FLUSH_INTERVAL', 5.0))
+    app.extensions['metrics'] = metrics
+    instrument_engine(engine)
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.get('request_start')
+        if start is not None:
+            metrics.observe_request(
+                request.endpoint or 'unmatched',
+                request.method,
+                response.status_code,
+                time.perf_counter() - start,
+                g.get('sql_queries', 0),
+                g.get('sql_seconds', 0.0)
+            )
+        return response
+
+    return metrics
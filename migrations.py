@@ -0,0 +1,54 @@
+"""
+In-place schema upgrades for existing database files
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, text
+from .models import db
+
+def dedupe_cart():
+    """Merge duplicate (user_id, product_id) cart rows into the oldest one"""
+    db.session.execute(text("""
+        UPDATE carts SET quantity = (
+            SELECT SUM(c.quantity) FROM carts c
+            WHERE c.user_id = carts.user_id AND c.product_id = carts.product_id
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM carts GROUP BY user_id, product_id HAVING COUNT(*) > 1
+        )
+    """))
+    db.session.execute(text("""
+        DELETE FROM carts WHERE id NOT IN (
+            SELECT MIN(id) FROM carts GROUP BY user_id, product_id
+        )
+    """))
+    db.session.commit()
+
+def ensure_indexes():
+    """Create any model index missing from an existing database
+
+    ``create_all`` only creates indexes together with new tables, so
+    databases created before an index was declared never get it.
+    Returns the names of the indexes that were created.
+    """
+    inspector = inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if table.name == 'carts' and index.unique:
+                dedupe_cart()
+            index.create(db.engine)
+            created.append(index.name)
+    return created
+
+@click.command('migrate-indexes')
+@with_appcontext
+def migrate_indexes_command():
+    """Add missing indexes to an existing database"""
+    created = ensure_indexes()
+    click.echo(f"Created {len(created)} indexes" + (f": {', '.join(created)}" if created else ''))
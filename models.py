@@ -1,13 +1,17 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from .passwords import password_hasher
+from .binds import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     """User model"""
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_is_admin_created_at', 'is_admin', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -24,12 +28,16 @@ class User(UserMixin, db.Model):
     orders = db.relationship('Order', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
-        """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        """Hash and set password using the configured policy"""
+        self.password_hash = password_hasher().hash(password)
     
     def check_password(self, password):
         """Check if password matches hash"""
-        return check_password_hash(self.password_hash, password)
+        return password_hasher().verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """Check if the stored hash predates the current hashing policy"""
+        return password_hasher().needs_rehash(self.password_hash)
     
     def to_dict(self):
         """Convert to dictionary"""
@@ -48,6 +56,13 @@ class User(UserMixin, db.Model):
 class Product(db.Model):
     """Product model"""
     __tablename__ = 'products'
+    __table_args__ = (
+        # is_available leads so the unfiltered storefront listing can use it too
+        db.Index('ix_products_is_available_category', 'is_available', 'category'),
+        db.Index('ix_products_category', 'category'),
+        # Also covers the inventory value, so it never reads the table
+        db.Index('ix_products_stock_price', 'stock', 'price'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -75,14 +90,22 @@ class Product(db.Model):
             'is_available': self.is_available
         }
 
+ORDER_STATUSES = ('pending', 'confirmed', 'shipped', 'delivered', 'cancelled')
+
 class Order(db.Model):
     """Order model"""
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Keyset pagination order (created_at, id), with and without filters
+        db.Index('ix_orders_created_at_id', 'created_at', 'id'),
+        db.Index('ix_orders_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_orders_status_created_at_id', 'status', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     total_amount = db.Column(db.Float, nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, confirmed, shipped, delivered, cancelled
+    status = db.Column(db.String(20), default='pending')  # one of ORDER_STATUSES
     delivery_date = db.Column(db.DateTime)
     special_instructions = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -107,6 +130,10 @@ class Order(db.Model):
 class OrderItem(db.Model):
     """Order Item model"""
     __tablename__ = 'order_items'
+    __table_args__ = (
+        db.Index('ix_order_items_order_id', 'order_id'),
+        db.Index('ix_order_items_product_id', 'product_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
@@ -128,6 +155,9 @@ class OrderItem(db.Model):
 class Cart(db.Model):
     """Shopping cart model"""
     __tablename__ = 'carts'
+    __table_args__ = (
+        db.Index('uq_carts_user_id_product_id', 'user_id', 'product_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -148,3 +178,118 @@ class Cart(db.Model):
             'quantity': self.quantity,
             'total_price': self.product.price * self.quantity
         }
+
+class DailySales(db.Model):
+    """Revenue and order count per day, maintained by the order write paths"""
+    __tablename__ = 'daily_sales'
+    
+    date = db.Column(db.Date, primary_key=True)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyProductSales(db.Model):
+    """Quantity and revenue per product per day"""
+    __tablename__ = 'daily_product_sales'
+    
+    date = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+class DailyCategorySales(db.Model):
+    """Order items, revenue and summed unit prices per category per day"""
+    __tablename__ = 'daily_category_sales'
+    
+    date = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    items_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    price_total = db.Column(db.Float, nullable=False, default=0)
+
+class DailyStatusCount(db.Model):
+    """Number of orders created on a day that are currently in each status"""
+    __tablename__ = 'daily_status_counts'
+    
+    date = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+
+class CustomerSales(db.Model):
+    """Order count and total spent per customer, for ranking top customers"""
+    __tablename__ = 'customer_sales'
+    __table_args__ = (
+        db.Index('ix_customer_sales_total_spent', 'total_spent'),
+    )
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    total_spent = db.Column(db.Float, nullable=False, default=0)
+
+class OrderStatusEvent(db.Model):
+    """One status change of an order; rows are only ever appended"""
+    __tablename__ = 'order_status_events'
+    __table_args__ = (
+        db.Index('ix_order_status_events_order_id_id', 'order_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    from_status = db.Column(db.String(20))  # None when the order was placed
+    to_status = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class DailyTransitionDuration(db.Model):
+    """Log-scale histogram of time spent in ``from_status`` before moving to ``to_status``
+
+    One row per histogram bucket per day the transition happened. Days (and
+    orders) merge by summing counts, so any date range can be summarized
+    without reading the event history. ``from_status`` 'placed' measures
+    from checkout rather than from the previous status.
+    """
+    __tablename__ = 'daily_transition_durations'
+    
+    from_status = db.Column(db.String(20), primary_key=True)
+    to_status = db.Column(db.String(20), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    seconds = db.Column(db.Float, nullable=False, default=0)
+
+class Job(db.Model):
+    """Background job, written in the same transaction as the change that caused it"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Workers claim the oldest due job
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    # Optional idempotency key; a second enqueue with the same key is ignored
+    key = db.Column(db.String(120), unique=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(64))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SentNotification(db.Model):
+    """Marker for a customer notification already delivered, so job retries skip it"""
+    __tablename__ = 'sent_notifications'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(120), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Generation(db.Model):
+    """Monotonic change counter per data set, shared by all worker processes"""
+    __tablename__ = 'generations'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
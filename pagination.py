@@ -0,0 +1,53 @@
+"""
+Keyset (cursor) pagination and filters for order listings
+"""
+import base64
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import tuple_
+from .models import Order
+
+def encode_cursor(order):
+    """Encode the (created_at, id) position of an order as an opaque cursor"""
+    raw = f'{order.created_at.isoformat()}|{order.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor back to (created_at, id); raises ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, order_id = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def page_limit(args):
+    """Read and clamp the ``limit`` query parameter"""
+    default = current_app.config.get('ORDERS_PAGE_SIZE', 50)
+    maximum = current_app.config.get('ORDERS_MAX_PAGE_SIZE', 200)
+    limit = args.get('limit', default, type=int)
+    return max(1, min(limit, maximum))
+
+def filter_orders(query, args):
+    """Apply status and created_at date range filters from query parameters"""
+    statuses = [s for value in args.getlist('status') for s in value.split(',') if s]
+    if statuses:
+        query = query.filter(Order.status.in_(statuses))
+    if args.get('date_from'):
+        query = query.filter(Order.created_at >= datetime.fromisoformat(args['date_from']))
+    if args.get('date_to'):
+        query = query.filter(Order.created_at < datetime.fromisoformat(args['date_to']))
+    return query
+
+def keyset_page(query, limit, cursor=None):
+    """Return one page of orders, newest first, and the cursor for the next page
+
+    The page is located by comparing against the last seen (created_at, id)
+    instead of an OFFSET, so deep pages cost the same as the first one.
+    """
+    if cursor:
+        created_at, order_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Order.created_at, Order.id) < tuple_(created_at, order_id))
+    rows = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
@@ -0,0 +1,69 @@
+"""
+Password hashing policy and a bounded executor for hashing work
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+class HashingBusy(Exception):
+    """Raised when too many hashing jobs are already queued"""
+
+def hash_method(algorithm, iterations):
+    """Build a werkzeug method string from an algorithm and work factor
+
+    For ``pbkdf2:<digest>`` the work factor is the iteration count; for
+    ``scrypt`` it is the CPU/memory cost N (r=8, p=1).
+    """
+    if algorithm == 'scrypt':
+        return f'scrypt:{iterations}:8:1'
+    return f'{algorithm}:{iterations}'
+
+class PasswordHasher:
+    """Runs hashing on a small dedicated pool to cap the CPU auth traffic uses
+
+    hashlib releases the GIL while deriving keys, so the pool lets up to
+    ``workers`` hashes run in parallel and no more. The calling request
+    thread still blocks until its hash is done, so this frees no request
+    threads. Instead, callers beyond ``max_pending`` are rejected with
+    HashingBusy, so login bursts cannot tie up every request thread.
+    """
+
+    def __init__(self, method, workers=2, max_pending=4):
+        self.method = method
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pwhash')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            hash_method(config.get('PASSWORD_HASH_ALGORITHM', 'scrypt'),
+                        config.get('PASSWORD_HASH_ITERATIONS', 32768)),
+            config.get('PASSWORD_HASH_WORKERS', 2),
+            config.get('PASSWORD_HASH_QUEUE') or max(1, config.get('REQUEST_THREADS', 8) // 2)
+        )
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if the hash was made with a different method than the policy"""
+        return pwhash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+def password_hasher():
+    """The app's PasswordHasher"""
+    return current_app.extensions['password_hasher']
@@ -0,0 +1,153 @@
+"""
+EXPLAIN QUERY PLAN regression check for every API route
+
+Usage: python -m backend.query_plans
+
+Seeds an in-memory database, calls each route, and runs EXPLAIN QUERY PLAN
+on every statement it issued. Exits non-zero if any statement falls back to
+a full table scan that is not listed in ALLOWED_SCANS.
+"""
+import re
+import sys
+from datetime import datetime, timedelta
+from .models import db, User, Product, Order, OrderItem, Cart
+from .querycount import count_queries
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+# (endpoint, table) pairs that read a whole table on purpose: dashboards only
+# aggregate the small rollup tables, and an unfiltered export is every order
+ALLOWED_SCANS = {
+    ('dashboard.get_dashboard_overview', 'daily_sales'),
+    ('dashboard.get_dashboard_overview', 'daily_status_counts'),
+    ('dashboard.get_top_products', 'daily_product_sales'),
+    ('dashboard.get_category_stats', 'daily_category_sales'),
+    ('dashboard.get_order_analytics', 'daily_status_counts'),
+    ('dashboard.get_order_analytics', 'daily_sales'),
+    ('admin.export_orders', 'orders'),
+}
+
+# Seeded orders are placed hourly from 90 days ago, so this range holds them
+ARCHIVE_RANGE = (
+    f'date_from={(datetime.utcnow() - timedelta(days=91)).date()}'
+    f'&date_to={(datetime.utcnow() - timedelta(days=70)).date()}'
+)
+
+ROUTES = [
+    ('customer', 'get', '/api/products', None),
+    ('customer', 'get', '/api/products?category=Cakes', None),
+    ('customer', 'get', '/api/products/category/Cakes', None),
+    ('customer', 'get', '/api/products/1', None),
+    ('customer', 'get', '/api/products/search?q=prod', None),
+    ('customer', 'get', '/api/cart', None),
+    ('customer', 'post', '/api/cart/add', {'product_id': 1, 'quantity': 1}),
+    ('customer', 'post', '/api/cart/batch', {'operations': [
+        {'op': 'add', 'product_id': 3},
+        {'op': 'set', 'product_id': 4, 'quantity': 2},
+        {'op': 'remove', 'product_id': 3}
+    ]}),
+    ('customer', 'get', '/api/orders', None),
+    ('customer', 'get', '/api/orders?status=pending', None),
+    ('customer', 'get', '/api/orders/1', None),
+    ('customer', 'get', '/api/orders/1/status', None),
+    ('customer', 'get', '/api/orders/1/invoice', None),
+    ('customer', 'post', '/api/orders', {}),
+    ('admin', 'get', '/api/admin/orders', None),
+    ('admin', 'get', '/api/admin/orders?status=pending', None),
+    ('admin', 'get', '/api/admin/orders?date_from=2026-01-01', None),
+    ('admin', 'put', '/api/admin/orders/1/status', {'status': 'shipped'}),
+    ('admin', 'get', '/api/admin/orders/export', None),
+    ('admin', 'get', '/api/admin/orders/export?format=csv&status=pending', None),
+    ('admin', 'get', f'/api/admin/invoices?{ARCHIVE_RANGE}', None),
+    ('admin', 'get', '/api/dashboard/overview', None),
+    ('admin', 'get', '/api/dashboard/revenue', None),
+    ('admin', 'get', '/api/dashboard/top-products', None),
+    ('admin', 'get', '/api/dashboard/customer-stats', None),
+    ('admin', 'get', '/api/dashboard/inventory', None),
+    ('admin', 'get', '/api/dashboard/order-analytics', None),
+    ('admin', 'get', '/api/dashboard/sales-trend', None),
+    ('admin', 'get', '/api/dashboard/category-stats', None),
+    ('admin', 'get', '/api/dashboard/performance-summary', None),
+]
+
+# Routes deliberately left out of ROUTES, with the reason
+EXCLUDED_ROUTES = {
+    'orders.order_events': 'Server-Sent Events stream; it only ends when the client disconnects',
+    'orders.user_order_events': 'Server-Sent Events stream; it only ends when the client disconnects',
+}
+
+def explain(statement, parameters):
+    """EXPLAIN QUERY PLAN detail lines for one statement"""
+    rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+    return [row[-1] for row in rows]
+
+def full_scans(statement, parameters):
+    """Tables a statement reads without using any index"""
+    if not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+        return []
+    return [m.group(1) for m in map(FULL_SCAN.match, explain(statement, parameters)) if m]
+
+def seed(users=20, products=30, orders=200):
+    """Enough rows that the planner prefers indexes where they exist"""
+    admin = User(username='admin', email='admin@example.com', is_admin=True)
+    admin.set_password('admin')
+    db.session.add(admin)
+    for i in range(users):
+        user = User(username=f'user{i}', email=f'user{i}@example.com')
+        user.set_password('user')
+        db.session.add(user)
+    for i in range(products):
+        db.session.add(Product(name=f'Product {i}', price=5 + i, category=('Cakes', 'Pastries')[i % 2], stock=100))
+    db.session.flush()
+    start = datetime.utcnow() - timedelta(days=90)
+    for i in range(orders):
+        order = Order(user_id=2 + i % users, total_amount=10, created_at=start + timedelta(hours=i))
+        db.session.add(order)
+        db.session.flush()
+        db.session.add(OrderItem(order_id=order.id, product_id=1 + i % products, quantity=1, unit_price=10))
+    db.session.add(Cart(user_id=2, product_id=2, quantity=1))
+    db.session.commit()
+
+def check_routes(app, routes=ROUTES, allowed=ALLOWED_SCANS):
+    """Call each route and return {(endpoint, url): [(table, sql), ...]} of disallowed scans"""
+    clients = {}
+    for role, username, password in (('admin', 'admin', 'admin'), ('customer', 'user0', 'user')):
+        clients[role] = app.test_client()
+        clients[role].post('/api/auth/login', json={'username': username, 'password': password})
+
+    failures = {}
+    for role, method, url, body in routes:
+        with app.app_context():
+            with count_queries() as counter:
+                kwargs = {'json': body} if body is not None else {}
+                response = getattr(clients[role], method)(url, **kwargs)
+                # Streamed bodies (export, archives) run their queries while being read
+                response.get_data()
+            endpoint = app.url_map.bind('').match(url.split('?')[0], method=method.upper())[0]
+            if response.status_code >= 400:
+                failures[(endpoint, url)] = [('-', f'HTTP {response.status_code}')]
+                continue
+            for statement, parameters in zip(counter.statements, counter.parameters):
+                for table in full_scans(statement, parameters):
+                    if (endpoint, table) not in allowed:
+                        failures.setdefault((endpoint, url), []).append((table, statement))
+    return failures
+
+def main():
+    from .app import create_app
+    from .config import TestingConfig
+
+    app = create_app(TestingConfig)
+    with app.app_context():
+        seed()
+    failures = check_routes(app)
+    for (endpoint, url), scans in failures.items():
+        for table, statement in scans:
+            print(f'FULL SCAN {table} in {endpoint} ({url}):\n    {" ".join(statement.split())}')
+    for endpoint, reason in EXCLUDED_ROUTES.items():
+        print(f'Skipped {endpoint}: {reason}')
+    print(f'{len(ROUTES)} routes checked, {len(failures)} with full table scans')
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+SQL query counting helpers for catching N+1 regressions
+
+Usage: python -m backend.querycount
+
+Checks that the order listings, order detail, order status update and
+dashboard overview issue the same number of queries however many orders,
+items and products they return.
+"""
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from .models import db, Order, OrderItem, Product
+from .generations import bump_generation, ORDERS
+
+class QueryCounter:
+    """Collects every statement executed on an engine while active"""
+
+    def __init__(self):
+        self.statements = []
+        self.parameters = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+        self.parameters.append(parameters[0] if executemany and parameters else parameters)
+
+@contextmanager
+def count_queries(engine=None):
+    """Count SQL statements executed on the engine inside the block"""
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter._before_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter._before_execute)
+
+def assert_constant_queries(app, client, url, grow, rounds=2, method='get', prepare=None, **kwargs):
+    """Assert a route issues the same number of queries as data grows
+
+    ``grow`` is called inside an app context between requests and should add
+    rows the route will return (more orders, more items per order, ...).
+    ``prepare``, if given, runs in an app context before every request, for
+    routes that change the data they are called on. A first, uncounted
+    request warms the per-worker caches (logged-in user, catalog) so they do
+    not show up as a difference.
+    """
+    if prepare is not None:
+        with app.app_context():
+            prepare()
+    getattr(client, method)(url, **kwargs).close()
+    counts = []
+    for i in range(rounds + 1):
+        with app.app_context():
+            if i:
+                grow()
+            if prepare is not None:
+                prepare()
+        with app.app_context():
+            with count_queries() as counter:
+                response = getattr(client, method)(url, **kwargs)
+                # Streamed bodies only run their queries when read
+                response.get_data()
+                response.close()
+        assert response.status_code < 400, f'{url} returned {response.status_code}'
+        counts.append(counter.count)
+    assert len(set(counts)) == 1, f'{url} query count grew with data: {counts}'
+    return counts[0]
+
+def _add_items(order_id, items):
+    for _ in range(items):
+        product = Product(name='Extra', price=10, category='Cakes', stock=10)
+        db.session.add(product)
+        db.session.flush()
+        db.session.add(OrderItem(order_id=order_id, product_id=product.id, quantity=1, unit_price=10))
+
+def add_orders(user_id=2, orders=5, items=3):
+    """Add recent orders for ``user_id``, each with ``items`` lines of new products"""
+    now = datetime.utcnow()
+    for i in range(orders):
+        order = Order(user_id=user_id, total_amount=items * 10, created_at=now + timedelta(seconds=i))
+        db.session.add(order)
+        db.session.flush()
+        _add_items(order.id, items)
+    bump_generation(ORDERS)
+    db.session.commit()
+
+def add_order_items(order_id=1, items=3):
+    """Add ``items`` lines of new products to an existing order"""
+    _add_items(order_id, items)
+    bump_generation(ORDERS)
+    db.session.commit()
+
+def add_recent_items(orders=5, items=3):
+    """Add ``items`` lines of new products to each of the newest ``orders`` orders"""
+    for order in Order.query.order_by(Order.created_at.desc()).limit(orders).all():
+        _add_items(order.id, items)
+    bump_generation(ORDERS)
+    db.session.commit()
+
+def reset_status(order_id=1):
+    """Put an order back to pending so the next status update is a real transition"""
+    db.session.get(Order, order_id).status = 'pending'
+    db.session.commit()
+
+# (role, method, url, body, grow, prepare) of routes whose query count must
+# not depend on the data. Order 1 belongs to the customer (user0)
+CONSTANT_ROUTES = [
+    ('customer', 'get', '/api/orders', None, add_orders, None),
+    ('customer', 'get', '/api/orders?status=pending', None, add_orders, None),
+    ('customer', 'get', '/api/orders/1', None, add_order_items, None),
+    ('admin', 'get', '/api/admin/orders', None, add_orders, None),
+    ('admin', 'get', '/api/admin/orders?status=pending', None, add_orders, None),
+    ('admin', 'get', '/api/admin/orders/export?format=ndjson', None, add_orders, None),
+    ('admin', 'put', '/api/admin/orders/1/status', {'status': 'confirmed'}, add_order_items, reset_status),
+    ('admin', 'get', '/api/dashboard/overview', None, add_recent_items, None),
+]
+
+def main():
+    from .app import create_app
+    from .config import TestingConfig
+    from .query_plans import seed
+
+    # Without the dashboard memo, so every request really runs its queries
+    app = create_app(type('QueryCountConfig', (TestingConfig,), {'DASHBOARD_CACHE_TTL': 0}))
+    with app.app_context():
+        seed()
+    clients = {}
+    for role, username, password in (('admin', 'admin', 'admin'), ('customer', 'user0', 'user')):
+        clients[role] = app.test_client()
+        clients[role].post('/api/auth/login', json={'username': username, 'password': password})
+
+    failures = 0
+    for role, method, url, body, grow, prepare in CONSTANT_ROUTES:
+        kwargs = {'json': body} if body is not None else {}
+        try:
+            count = assert_constant_queries(app, clients[role], url, grow, method=method, prepare=prepare, **kwargs)
+        except AssertionError as e:
+            failures += 1
+            print(f'FAIL {e}')
+        else:
+            print(f'ok   {method.upper()} {url}: {count} queries')
+    print(f'{len(CONSTANT_ROUTES)} routes checked, {failures} with growing query counts')
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Read-only copy of the main database for dashboard queries
+
+The copy is taken with SQLite's online backup API into a temporary file
+and renamed into place, so dashboard reads never hold locks on the file
+checkout writes to. Connections to the copy are opened per query, so each
+one sees the newest copy while queries already running finish on the old.
+Copies are made by a background thread or the refresh-analytics-db
+command, never by a request.
+
+Every refresh copies the whole file, however few rows changed: the cost
+is a read of the main database and a write of the same size. The refresh
+interval therefore grows with the size of the copy, by
+``staleness_per_mb`` seconds per MiB.
+"""
+import os
+import sqlite3
+import threading
+import time
+import click
+from flask import current_app, g
+from flask.cli import with_appcontext
+from flask_login import current_user
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+from .models import db
+
+BIND = 'analytics'
+
+def configure_analytics_bind(app):
+    """Add the read-only 'analytics' bind if the main database is a SQLite file in WAL mode
+
+    Outside WAL mode the backup's read lock blocks checkout for the whole
+    copy, so the bind is left off. Must run before db.init_app. Returns the
+    path of the copy, or None.
+    """
+    if not app.config.get('ANALYTICS_DB_ENABLED'):
+        return None
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    if str(pragmas.get('journal_mode', '')).upper() != 'WAL':
+        return None
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    path = os.path.abspath(app.config.get('ANALYTICS_DB_PATH') or os.path.join(app.instance_path, 'analytics.db'))
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds[BIND] = {'url': f'sqlite:///file:{path}?mode=ro&uri=true', 'poolclass': NullPool}
+    app.config['SQLALCHEMY_BINDS'] = binds
+    return path
+
+class AnalyticsReplica:
+    """Keeps the copy at ``path`` no older than ``interval()`` seconds
+
+    The interval is ``max_staleness``, or ``staleness_per_mb`` seconds per
+    MiB of the copy if that is longer, so large databases are copied less
+    often instead of being re-read end to end every few seconds. A refresh is skipped (and the copy's age reset) when nothing has been
+    committed to the main database since the last copy. With
+    ``pages_per_step`` > 0 the backup runs in steps, releasing the read
+    lock on the main database in between; in WAL mode a single step never
+    blocks writers.
+    """
+
+    def __init__(self, source, path, max_staleness=30.0, pages_per_step=-1, uri=False, staleness_per_mb=1.0):
+        self.source = source
+        self.path = path
+        self.max_staleness = max_staleness
+        self.staleness_per_mb = staleness_per_mb
+        self.pages_per_step = pages_per_step
+        self.uri = uri
+        self.copies = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._data_version = None
+
+    def age(self):
+        """Seconds since the copy was taken, or None if there is no copy"""
+        try:
+            return time.time() - os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def interval(self):
+        """Seconds a copy may age before the next one, scaled by the copy's size"""
+        try:
+            size = os.stat(self.path).st_size
+        except OSError:
+            return self.max_staleness
+        return max(self.max_staleness, size / (1024 * 1024) * self.staleness_per_mb)
+
+    def usable(self):
+        """True if the copy exists and its refresher has kept up
+
+        Twice the interval leaves room for a copy in progress; past that
+        the refresher has stopped and requests read the main database.
+        """
+        age = self.age()
+        return age is not None and age < 2 * self.interval()
+
+    def ensure_fresh(self):
+        """Refresh the copy if it is too old
+
+        The copy's mtime is shared, so a copy made by another worker
+        process (or the CLI) counts too.
+        """
+        age = self.age()
+        if age is not None and age < self.interval():
+            return False
+        with self._lock:
+            age = self.age()
+            if age is None or age >= self.interval():
+                return self._refresh(force=False)
+        return False
+
+    def start_refresher(self, logger):
+        """Keep the copy fresh from a daemon thread in this process"""
+        threading.Thread(target=self._refresh_loop, args=(logger,), name='analytics-db', daemon=True).start()
+
+    def _refresh_loop(self, logger):
+        while True:
+            try:
+                self.ensure_fresh()
+            except (sqlite3.Error, OSError):
+                logger.exception('Analytics database refresh failed')
+            time.sleep(self.interval() / 4)
+
+    def refresh(self, force=False):
+        """Bring the copy up to date now; True if the database was copied"""
+        with self._lock:
+            return self._refresh(force)
+
+    def _refresh(self, force):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.source, uri=self.uri, check_same_thread=False)
+        # data_version changes whenever another connection (in any process) commits
+        version = self._connection.execute('PRAGMA data_version').fetchone()[0]
+        started = time.time()
+        if not force and version == self._data_version and os.path.exists(self.path):
+            os.utime(self.path, (started, started))
+            return False
+        
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        target = sqlite3.connect(tmp)
+        try:
+            self._connection.backup(target, pages=self.pages_per_step)
+            # Readers of the copy need no WAL files; it is never written again
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+        # Age is measured from when the copy started, not when it finished
+        os.utime(tmp, (started, started))
+        os.replace(tmp, self.path)
+        self._data_version = version
+        self.copies += 1
+        return True
+
+def create_analytics_replica(app, path):
+    """AnalyticsReplica for the app's main database, or None without a path
+
+    Starts the background refresher unless ANALYTICS_DB_REFRESH is off, in
+    which case the refresh-analytics-db command has to be run on a schedule.
+    """
+    if path is None:
+        return None
+    url = db.engine.url
+    replica = AnalyticsReplica(
+        url.database,
+        path,
+        app.config.get('ANALYTICS_DB_MAX_STALENESS', 30.0),
+        app.config.get('ANALYTICS_DB_PAGES_PER_STEP', -1),
+        uri=bool(url.query.get('uri')),
+        staleness_per_mb=app.config.get('ANALYTICS_DB_STALENESS_PER_MB', 1.0)
+    )
+    if app.config.get('ANALYTICS_DB_REFRESH', True):
+        replica.start_refresher(app.logger)
+    return replica
+
+def use_analytics_db():
+    """Send the rest of the request's queries to the analytics copy
+
+    Registered with before_request on blueprints that only read. Reads the
+    main database while there is no usable copy.
+    """
+    replica = current_app.extensions.get('analytics_db')
+    # Authenticate against the main database; a new admin may not be copied yet
+    if replica is None or not current_user.is_authenticated or not replica.usable():
+        return
+    g.db_bind = BIND
+
+@click.command('refresh-analytics-db')
+@with_appcontext
+def refresh_analytics_db_command():
+    """Copy the main database to the dashboard's read-only analytics database"""
+    replica = current_app.extensions.get('analytics_db')
+    if replica is None:
+        raise click.ClickException('The analytics database is disabled or the main database is not a SQLite file')
+    started = time.perf_counter()
+    replica.refresh(force=True)
+    click.echo(f'Copied to {replica.path} in {time.perf_counter() - started:.2f}s')
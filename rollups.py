@@ -0,0 +1,231 @@
+"""
+Incrementally maintained sales rollups for the dashboard
+"""
+import math
+from collections import defaultdict
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select, func, delete
+from sqlalchemy.dialects.sqlite import insert
+from .generations import bump_generation, ORDERS
+from .models import (
+    db, Product, Order, OrderItem, OrderStatusEvent, CustomerSales,
+    DailySales, DailyProductSales, DailyCategorySales, DailyStatusCount, DailyTransitionDuration
+)
+
+ROLLUP_MODELS = (
+    DailySales, DailyProductSales, DailyCategorySales, DailyStatusCount, DailyTransitionDuration, CustomerSales
+)
+
+# Durations are bucketed on a log scale with buckets 2% wide, so quantiles
+# read back from the histogram are within 2% of the exact value
+DURATION_GAMMA = 1.02
+PLACED = 'placed'
+DURATION_KEYS = ['from_status', 'to_status', 'date', 'bucket']
+
+def _increment(model, keys, rows):
+    """Upsert rows, adding every non-key column onto the existing values"""
+    if not rows:
+        return
+    stmt = insert(model)
+    amounts = [name for name in rows[0] if name not in keys]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: getattr(model, name) + getattr(stmt.excluded, name) for name in amounts}
+    )
+    db.session.execute(stmt, rows)
+
+def duration_bucket(seconds):
+    """Histogram bucket holding ``seconds``; anything up to a second is bucket 0"""
+    if seconds <= 1:
+        return 0
+    return math.ceil(math.log(seconds, DURATION_GAMMA))
+
+def _durations(placed_at, entered, from_status, to_status, at):
+    """Histogram rows for one status change made at ``at``
+
+    ``placed_at`` is the order's created_at and ``entered`` is when it
+    reached ``from_status``, or None if that is not known.
+    """
+    spans = []
+    if entered is not None:
+        spans.append((from_status, (at - entered).total_seconds()))
+    if to_status == 'delivered':
+        spans.append((PLACED, (at - placed_at).total_seconds()))
+    return [
+        {
+            'from_status': status, 'to_status': to_status, 'date': at.date(),
+            'bucket': duration_bucket(seconds), 'count': 1, 'seconds': max(seconds, 0.0)
+        }
+        for status, seconds in spans
+    ]
+
+def record_order(order, lines):
+    """Add a new order to the rollups inside the caller's transaction
+
+    ``lines`` is an iterable of (product_id, category, quantity, unit_price)
+    for the order's items. The order must be flushed so created_at is set.
+    """
+    day = order.created_at.date()
+    products = defaultdict(lambda: [0, 0.0])
+    categories = defaultdict(lambda: [0, 0.0, 0.0])
+    for product_id, category, quantity, unit_price in lines:
+        products[product_id][0] += quantity
+        products[product_id][1] += quantity * unit_price
+        categories[category][0] += 1
+        categories[category][1] += quantity * unit_price
+        categories[category][2] += unit_price
+    
+    _increment(DailySales, ['date'], [{'date': day, 'revenue': order.total_amount, 'orders': 1}])
+    _increment(DailyStatusCount, ['date', 'status'], [{'date': day, 'status': order.status, 'orders': 1}])
+    _increment(CustomerSales, ['user_id'], [{'user_id': order.user_id, 'orders': 1, 'total_spent': order.total_amount}])
+    _increment(DailyProductSales, ['date', 'product_id'], [
+        {'date': day, 'product_id': product_id, 'quantity': quantity, 'revenue': revenue}
+        for product_id, (quantity, revenue) in products.items()
+    ])
+    _increment(DailyCategorySales, ['date', 'category'], [
+        {'date': day, 'category': category, 'items_sold': items, 'revenue': revenue, 'price_total': prices}
+        for category, (items, revenue, prices) in categories.items()
+    ])
+    db.session.execute(insert(OrderStatusEvent).values(
+        order_id=order.id, from_status=None, to_status=order.status, created_at=order.created_at
+    ))
+
+def record_status_change(order, old_status, new_status, at=None):
+    """Log a status change and move the order between status counts
+
+    Runs inside the caller's transaction. The time spent in ``old_status``
+    is added to the transition histograms.
+    """
+    if old_status == new_status:
+        return
+    at = at or datetime.utcnow()
+    day = order.created_at.date()
+    _increment(DailyStatusCount, ['date', 'status'], [
+        {'date': day, 'status': old_status, 'orders': -1},
+        {'date': day, 'status': new_status, 'orders': 1}
+    ])
+    
+    entered = db.session.execute(
+        select(OrderStatusEvent.created_at)
+        .where(OrderStatusEvent.order_id == order.id)
+        .order_by(OrderStatusEvent.id.desc()).limit(1)
+    ).scalar()
+    if entered is None and old_status == 'pending':
+        # Placed before status history was kept
+        entered = order.created_at
+    db.session.execute(insert(OrderStatusEvent).values(
+        order_id=order.id, from_status=old_status, to_status=new_status, created_at=at
+    ))
+    _increment(DailyTransitionDuration, DURATION_KEYS, _durations(order.created_at, entered, old_status, new_status, at))
+
+def transition_summary(from_status, to_status, since=None, quantiles=(0.5, 0.9, 0.99)):
+    """Count, mean and quantiles (in seconds) of one transition's durations
+
+    Merges the daily histograms from ``since`` (a date) onwards. Returns
+    None if the transition never happened in that range.
+    """
+    query = db.session.query(
+        DailyTransitionDuration.bucket,
+        func.sum(DailyTransitionDuration.count),
+        func.sum(DailyTransitionDuration.seconds)
+    ).filter(
+        DailyTransitionDuration.from_status == from_status,
+        DailyTransitionDuration.to_status == to_status
+    )
+    if since is not None:
+        query = query.filter(DailyTransitionDuration.date >= since)
+    buckets = query.group_by(DailyTransitionDuration.bucket).order_by(DailyTransitionDuration.bucket).all()
+    total = sum(count for _, count, _ in buckets)
+    if not total:
+        return None
+    
+    summary = {'count': total, 'mean': sum(seconds for _, _, seconds in buckets) / total}
+    seen = 0
+    wanted = iter(sorted(quantiles))
+    q = next(wanted)
+    for _, count, seconds in buckets:
+        seen += count
+        # A bucket's mean always lies inside the bucket
+        while q is not None and seen > q * (total - 1):
+            summary[q] = seconds / count
+            q = next(wanted, None)
+    return summary
+
+def rebuild_rollups():
+    """Recompute every rollup table from order history"""
+    for model in ROLLUP_MODELS:
+        db.session.execute(delete(model))
+    _rebuild_durations()
+    
+    order_day = func.date(Order.created_at)
+    line_revenue = OrderItem.quantity * OrderItem.unit_price
+    
+    db.session.execute(insert(DailySales).from_select(
+        ['date', 'revenue', 'orders'],
+        select(order_day, func.sum(Order.total_amount), func.count(Order.id)).group_by(order_day)
+    ))
+    db.session.execute(insert(DailyStatusCount).from_select(
+        ['date', 'status', 'orders'],
+        select(order_day, Order.status, func.count(Order.id)).group_by(order_day, Order.status)
+    ))
+    db.session.execute(insert(CustomerSales).from_select(
+        ['user_id', 'orders', 'total_spent'],
+        select(Order.user_id, func.count(Order.id), func.sum(Order.total_amount)).group_by(Order.user_id)
+    ))
+    db.session.execute(insert(DailyProductSales).from_select(
+        ['date', 'product_id', 'quantity', 'revenue'],
+        select(order_day, OrderItem.product_id, func.sum(OrderItem.quantity), func.sum(line_revenue))
+        .join(Order, Order.id == OrderItem.order_id)
+        .group_by(order_day, OrderItem.product_id)
+    ))
+    db.session.execute(insert(DailyCategorySales).from_select(
+        ['date', 'category', 'items_sold', 'revenue', 'price_total'],
+        select(
+            order_day, Product.category, func.count(OrderItem.id),
+            func.sum(line_revenue), func.sum(OrderItem.unit_price)
+        )
+        .join(Order, Order.id == OrderItem.order_id)
+        .join(Product, Product.id == OrderItem.product_id)
+        .group_by(order_day, Product.category)
+    ))
+    bump_generation(ORDERS)
+    db.session.commit()
+
+def _rebuild_durations(batch_size=10000):
+    """Replay the status history into the transition histograms"""
+    histogram = defaultdict(lambda: [0, 0.0])
+    events = db.session.execute(
+        select(
+            OrderStatusEvent.order_id, OrderStatusEvent.from_status,
+            OrderStatusEvent.to_status, OrderStatusEvent.created_at, Order.created_at
+        ).join(Order, Order.id == OrderStatusEvent.order_id)
+        .order_by(OrderStatusEvent.order_id, OrderStatusEvent.id)
+        .execution_options(yield_per=batch_size)
+    )
+    previous_order, entered = None, None
+    for order_id, from_status, to_status, at, placed_at in events:
+        if order_id != previous_order:
+            previous_order = order_id
+            entered = placed_at if from_status == 'pending' else None
+        if from_status is not None:
+            for row in _durations(placed_at, entered, from_status, to_status, at):
+                bucket = histogram[tuple(row[key] for key in DURATION_KEYS)]
+                bucket[0] += 1
+                bucket[1] += row['seconds']
+        entered = at
+    
+    rows = [
+        dict(zip(DURATION_KEYS, key), count=count, seconds=seconds)
+        for key, (count, seconds) in histogram.items()
+    ]
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(insert(DailyTransitionDuration), rows[start:start + batch_size])
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """Recompute the dashboard rollup tables from order history"""
+    rebuild_rollups()
+    click.echo('Rollups rebuilt')
@@ -1,7 +1,26 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context, current_app, send_file
 from flask_login import login_user, logout_user, login_required, current_user
-from .models import db, User, Product, Order, OrderItem, Cart
+from .models import db, User, Product, Order, OrderItem, Cart, ORDER_STATUSES
+from .loading import order_query
+from .pagination import page_limit, filter_orders, keyset_page
+from .export import export_statement, export_rows, generate_ndjson, generate_csv
+from .catalog import cached_catalog_response, bump_catalog_version, bump_stock_version
+from .generations import bump_generation, ORDERS, USERS
+from .rollups import record_order, record_status_change
+from .passwords import HashingBusy
+from .slowlog import slow_query_log
+from .serializers import product_query, product_dicts, order_query_rows, order_dicts
+from .search import match_expression, search_products
+from .events import status_message, publish_order_status, stream_response
+from .jobs import enqueue
+from .invoices import cached_invoice, write_archive, archive_query, check_archive_range
+from collections import namedtuple
 from datetime import datetime
+from urllib.parse import urlencode
+import tempfile
+from sqlalchemy import insert, update, delete, select, literal, literal_column
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload
 
 # Create blueprints
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
@@ -12,6 +31,11 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
 # ==================== AUTH ROUTES ====================
 
+@auth_bp.errorhandler(HashingBusy)
+def hashing_busy(e):
+    """Shed auth load instead of queueing behind a full hashing pool"""
+    return jsonify({'error': 'Too many login attempts in progress, please retry'}), 503, {'Retry-After': '1'}
+
 @auth_bp.route('/signup', methods=['POST'])
 def signup():
     """Register a new user"""
@@ -35,6 +59,7 @@ def signup():
     user.set_password(data['password'])
     
     db.session.add(user)
+    bump_generation(USERS)
     db.session.commit()
     
     login_user(user)
@@ -53,6 +78,11 @@ def login():
     if not user or not user.check_password(data['password']):
         return jsonify({'error': 'Invalid username or password'}), 401
     
+    # Upgrade hashes made under an older policy while we have the plaintext
+    if user.password_needs_rehash():
+        user.set_password(data['password'])
+        db.session.commit()
+    
     login_user(user)
     return jsonify({'message': 'Login successful', 'user': user.to_dict()}), 200
 
@@ -85,52 +115,116 @@ def update_profile():
         current_user.address = data['address']
     
     current_user.updated_at = datetime.utcnow()
+    bump_generation(USERS)
     db.session.commit()
     
     return jsonify({'message': 'Profile updated', 'user': current_user.to_dict()}), 200
 
 # ==================== PRODUCT ROUTES ====================
 
+def available_products_response(category=None):
+    """Cached listing of available products, optionally for one category"""
+    def build():
+        products = product_query().filter_by(is_available=True)
+        if category:
+            products = products.filter_by(category=category)
+        return product_dicts(products.all())
+    
+    return cached_catalog_response(f'products:{category or ""}', build)
+
 @product_bp.route('', methods=['GET'])
 def get_products():
     """Get all products"""
-    category = request.args.get('category')
-    products = Product.query.filter_by(is_available=True)
+    return available_products_response(request.args.get('category'))
+
+@product_bp.route('/search', methods=['GET'])
+def search():
+    """Ranked full-text product search with prefix matching for typeahead"""
+    expression = match_expression(request.args.get('q', ''))
+    if expression is None:
+        return jsonify({'error': 'Search query is required'}), 400
+    
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    offset = max(0, request.args.get('offset', 0, type=int))
     
-    if category:
-        products = products.filter_by(category=category)
+    def build():
+        products, next_offset = search_products(expression, limit, offset)
+        return {'products': products, 'next_offset': next_offset}
     
-    return jsonify([p.to_dict() for p in products.all()]), 200
+    return cached_catalog_response(f'search:{expression}:{limit}:{offset}', build)
 
 @product_bp.route('/<int:product_id>', methods=['GET'])
 def get_product(product_id):
     """Get product by ID"""
-    product = Product.query.get(product_id)
+    def build():
+        products = product_dicts(product_query().filter(Product.id == product_id).all())
+        return products[0] if products else None
     
-    if not product:
+    response = cached_catalog_response(f'product:{product_id}', build)
+    if response is None:
         return jsonify({'error': 'Product not found'}), 404
     
-    return jsonify(product.to_dict()), 200
+    return response
 
 @product_bp.route('/category/<category>', methods=['GET'])
 def get_products_by_category(category):
     """Get products by category"""
-    products = Product.query.filter_by(category=category, is_available=True)
-    return jsonify([p.to_dict() for p in products.all()]), 200
+    return available_products_response(category)
 
 # ==================== CART ROUTES ====================
 
+def valid_quantity(quantity, minimum=1):
+    """True for an integer quantity of at least ``minimum`` (JSON true/false are not numbers)"""
+    return isinstance(quantity, int) and not isinstance(quantity, bool) and quantity >= minimum
+
+def upsert_cart_item(user_id, product_id, quantity, replace=False):
+    """Add to (or with ``replace``, set) a cart line in one INSERT ... ON CONFLICT
+
+    The row is only inserted if the product exists. Returns the cart item
+    as a dict, or None if there is no such product.
+    """
+    source = select(
+        literal(user_id), Product.id, literal(quantity), literal(datetime.utcnow())
+    ).where(Product.id == product_id)
+    stmt = sqlite_insert(Cart).from_select(['user_id', 'product_id', 'quantity', 'added_at'], source)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Cart.user_id, Cart.product_id],
+        set_={'quantity': stmt.excluded.quantity if replace else Cart.quantity + stmt.excluded.quantity}
+    )
+    # SQLite renders RETURNING columns unqualified, so the product lookups are spelled out
+    stmt = stmt.returning(
+        Cart.id,
+        Cart.quantity,
+        literal_column('(SELECT name FROM products WHERE products.id = carts.product_id)'),
+        literal_column('(SELECT price FROM products WHERE products.id = carts.product_id)')
+    )
+    row = db.session.execute(stmt).first()
+    if row is None:
+        return None
+    
+    item_id, quantity, name, price = row
+    return {
+        'id': item_id,
+        'product_id': product_id,
+        'product_name': name,
+        'product_price': price,
+        'quantity': quantity,
+        'total_price': price * quantity
+    }
+
+def cart_contents(user_id):
+    """Cart items with their products loaded in the same query"""
+    cart_items = Cart.query.options(joinedload(Cart.product)).filter_by(user_id=user_id).all()
+    return {
+        'items': [item.to_dict() for item in cart_items],
+        'total': sum(item.product.price * item.quantity for item in cart_items)
+    }
+
 @cart_bp.route('', methods=['GET'])
 @login_required
 def get_cart():
     """Get user's cart"""
-    cart_items = Cart.query.filter_by(user_id=current_user.id).all()
-    total = sum(item.product.price * item.quantity for item in cart_items)
-    
-    return jsonify({
-        'items': [item.to_dict() for item in cart_items],
-        'total': total
-    }), 200
+    return jsonify(cart_contents(current_user.id)), 200
 
 @cart_bp.route('/add', methods=['POST'])
 @login_required
@@ -141,29 +235,50 @@ def add_to_cart():
     if not data or 'product_id' not in data:
         return jsonify({'error': 'Product ID required'}), 400
     
-    product = Product.query.get(data['product_id'])
-    if not product:
-        return jsonify({'error': 'Product not found'}), 404
-    
     quantity = data.get('quantity', 1)
+    if not valid_quantity(quantity):
+        return jsonify({'error': 'Quantity must be a positive integer'}), 400
     
-    cart_item = Cart.query.filter_by(
-        user_id=current_user.id,
-        product_id=data['product_id']
-    ).first()
+    item = upsert_cart_item(current_user.id, data['product_id'], quantity)
+    if item is None:
+        return jsonify({'error': 'Product not found'}), 404
     
-    if cart_item:
-        cart_item.quantity += quantity
-    else:
-        cart_item = Cart(
-            user_id=current_user.id,
-            product_id=data['product_id'],
-            quantity=quantity
-        )
-        db.session.add(cart_item)
+    db.session.commit()
+    return jsonify({'message': 'Added to cart', 'item': item}), 201
+
+@cart_bp.route('/batch', methods=['POST'])
+@login_required
+def batch_cart():
+    """Apply a list of add/set/remove operations to the cart in one transaction"""
+    data = request.get_json()
+    operations = data.get('operations') if data else None
+    
+    if not isinstance(operations, list):
+        return jsonify({'error': 'Operations list required'}), 400
+    
+    for op in operations:
+        if not isinstance(op, dict) or op.get('op') not in ('add', 'set', 'remove') or 'product_id' not in op:
+            return jsonify({'error': 'Each operation needs op (add, set or remove) and product_id'}), 400
+        if op['op'] != 'remove' and not valid_quantity(op.get('quantity', 1), 1 if op['op'] == 'add' else 0):
+            return jsonify({'error': 'Quantity must be a positive integer (or 0 to remove with set)'}), 400
+    
+    missing = []
+    for op in operations:
+        quantity = op.get('quantity', 1)
+        if op['op'] == 'remove' or (op['op'] == 'set' and quantity <= 0):
+            db.session.execute(delete(Cart).where(
+                Cart.user_id == current_user.id,
+                Cart.product_id == op['product_id']
+            ))
+        elif upsert_cart_item(current_user.id, op['product_id'], quantity, replace=op['op'] == 'set') is None:
+            missing.append(op['product_id'])
+    
+    if missing:
+        db.session.rollback()
+        return jsonify({'error': 'Product not found', 'product_ids': missing}), 404
     
     db.session.commit()
-    return jsonify({'message': 'Added to cart', 'item': cart_item.to_dict()}), 201
+    return jsonify(cart_contents(current_user.id)), 200
 
 @cart_bp.route('/remove/<int:item_id>', methods=['DELETE'])
 @login_required
@@ -190,56 +305,133 @@ def clear_cart():
 
 # ==================== ORDER ROUTES ====================
 
+def paginated_orders(query):
+    """Filter and keyset-paginate an order_query_rows query from request args
+
+    The body stays a plain list of orders; the next page is announced in
+    the X-Next-Cursor and Link headers.
+    """
+    try:
+        query = filter_orders(query, request.args)
+        orders, next_cursor = keyset_page(query, page_limit(request.args), request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    headers = {}
+    if next_cursor:
+        args = request.args.copy()
+        args['cursor'] = next_cursor
+        headers['X-Next-Cursor'] = next_cursor
+        headers['Link'] = f'<{request.path}?{urlencode(list(args.items(multi=True)))}>; rel="next"'
+    return jsonify(order_dicts(orders)), 200, headers
+
+CheckoutLine = namedtuple('CheckoutLine', 'product_id quantity name price category')
+
 @order_bp.route('', methods=['POST'])
 @login_required
 def create_order():
     """Create order from cart"""
-    data = request.get_json()
-    
-    cart_items = Cart.query.filter_by(user_id=current_user.id).all()
+    data = request.get_json() or {}
+    
+    # Claiming the cart is the first write, so it takes SQLite's write lock
+    # and a concurrent checkout of the same cart finds it already empty
+    claimed = db.session.execute(
+        delete(Cart).where(Cart.user_id == current_user.id)
+        .returning(Cart.product_id, Cart.quantity),
+        execution_options={'synchronize_session': False}
+    ).all()
+    if any(quantity <= 0 for _, quantity in claimed):
+        db.session.rollback()
+        return jsonify({'error': 'Cart quantities must be positive'}), 400
+    
+    products = {
+        row.id: row for row in db.session.query(
+            Product.id, Product.name, Product.price, Product.category
+        ).filter(Product.id.in_([product_id for product_id, _ in claimed]))
+    }
+    # Lines for products that no longer exist are dropped with the cart
+    cart_items = [
+        CheckoutLine(product_id, quantity, products[product_id].name,
+                     products[product_id].price, products[product_id].category)
+        for product_id, quantity in sorted(claimed) if product_id in products
+    ]
     if not cart_items:
+        db.session.rollback()
         return jsonify({'error': 'Cart is empty'}), 400
     
-    total_amount = sum(item.product.price * item.quantity for item in cart_items)
-    
     order = Order(
         user_id=current_user.id,
-        total_amount=total_amount,
+        total_amount=sum(item.price * item.quantity for item in cart_items),
         special_instructions=data.get('special_instructions')
     )
     
     if data.get('delivery_date'):
         order.delivery_date = datetime.fromisoformat(data['delivery_date'])
     
+    # Conditional UPDATEs in the same transaction, so checkout cannot oversell
+    out_of_stock = []
+    for item in cart_items:
+        result = db.session.execute(
+            update(Product)
+            .where(Product.id == item.product_id, Product.stock >= item.quantity)
+            .values(stock=Product.stock - item.quantity)
+        )
+        if result.rowcount == 0:
+            out_of_stock.append(item)
+    
+    if out_of_stock:
+        available = dict(db.session.query(Product.id, Product.stock).filter(
+            Product.id.in_([item.product_id for item in out_of_stock])
+        ).all())
+        db.session.rollback()
+        return jsonify({
+            'error': 'Insufficient stock',
+            'items': [
+                {
+                    'product_id': item.product_id,
+                    'product_name': item.name,
+                    'requested': item.quantity,
+                    'available': available.get(item.product_id, 0)
+                }
+                for item in out_of_stock
+            ]
+        }), 409
+    
     db.session.add(order)
     db.session.flush()
     
-    for cart_item in cart_items:
-        order_item = OrderItem(
-            order_id=order.id,
-            product_id=cart_item.product_id,
-            quantity=cart_item.quantity,
-            unit_price=cart_item.product.price
-        )
-        db.session.add(order_item)
-    
-    Cart.query.filter_by(user_id=current_user.id).delete()
+    db.session.execute(insert(OrderItem), [
+        {
+            'order_id': order.id,
+            'product_id': item.product_id,
+            'quantity': item.quantity,
+            'unit_price': item.price
+        }
+        for item in cart_items
+    ])
+    record_order(order, [
+        (item.product_id, item.category, item.quantity, item.price)
+        for item in cart_items
+    ])
+    bump_stock_version()
+    bump_generation(ORDERS)
+    enqueue('order.placed', {'order_id': order.id}, key=f'order.placed:{order.id}')
     db.session.commit()
     
+    order = order_query().filter_by(id=order.id).one()
     return jsonify({'message': 'Order created', 'order': order.to_dict()}), 201
 
 @order_bp.route('', methods=['GET'])
 @login_required
 def get_orders():
     """Get user's orders"""
-    orders = Order.query.filter_by(user_id=current_user.id).all()
-    return jsonify([order.to_dict() for order in orders]), 200
+    return paginated_orders(order_query_rows().filter(Order.user_id == current_user.id))
 
 @order_bp.route('/<int:order_id>', methods=['GET'])
 @login_required
 def get_order(order_id):
     """Get order details"""
-    order = Order.query.get(order_id)
+    order = order_query().filter_by(id=order_id).first()
     
     if not order or order.user_id != current_user.id:
         return jsonify({'error': 'Order not found'}), 404
@@ -262,6 +454,48 @@ def get_order_status(order_id):
         'updated_at': order.updated_at.isoformat()
     }), 200
 
+@order_bp.route('/<int:order_id>/invoice', methods=['GET'])
+@login_required
+def get_invoice(order_id):
+    """Printable HTML invoice, rendered once per version of the order"""
+    order = order_query().filter_by(id=order_id).first()
+    
+    if not order or (order.user_id != current_user.id and not current_user.is_admin):
+        return jsonify({'error': 'Order not found'}), 404
+    
+    key, body = cached_invoice(order)
+    response = Response(body, mimetype='text/html')
+    response.set_etag(key)
+    return response.make_conditional(request)
+
+@order_bp.route('/<int:order_id>/events', methods=['GET'])
+@login_required
+def order_events(order_id):
+    """Stream status changes of one order as Server-Sent Events"""
+    order = Order.query.get(order_id)
+    
+    if not order or order.user_id != current_user.id:
+        return jsonify({'error': 'Order not found'}), 404
+    
+    response = stream_response(
+        [f'order:{order_id}'], current_user.id,
+        lambda: [status_message(db.session.get(Order, order_id, populate_existing=True))]
+    )
+    if response is None:
+        return jsonify({'error': 'Too many open event streams'}), 429
+    
+    return response
+
+@order_bp.route('/events', methods=['GET'])
+@login_required
+def user_order_events():
+    """Stream status changes of all the user's orders as Server-Sent Events"""
+    response = stream_response([f'user:{current_user.id}'], current_user.id)
+    if response is None:
+        return jsonify({'error': 'Too many open event streams'}), 429
+    
+    return response
+
 # ==================== ADMIN ROUTES ====================
 
 @admin_bp.route('/products', methods=['POST'])
@@ -286,6 +520,7 @@ def create_product():
     )
     
     db.session.add(product)
+    bump_catalog_version()
     db.session.commit()
     
     return jsonify({'message': 'Product created', 'product': product.to_dict()}), 201
@@ -317,6 +552,7 @@ def update_product(product_id):
         product.is_available = data['is_available']
     
     product.updated_at = datetime.utcnow()
+    bump_catalog_version()
     db.session.commit()
     
     return jsonify({'message': 'Product updated', 'product': product.to_dict()}), 200
@@ -328,8 +564,79 @@ def get_all_orders():
     if not current_user.is_admin:
         return jsonify({'error': 'Admin access required'}), 403
     
-    orders = Order.query.all()
-    return jsonify([order.to_dict() for order in orders]), 200
+    return paginated_orders(order_query_rows())
+
+@admin_bp.route('/orders/export', methods=['GET'])
+@login_required
+def export_orders():
+    """Stream all orders with their items as NDJSON or CSV (admin only)"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'Format must be ndjson or csv'}), 400
+    
+    try:
+        stmt = filter_orders(export_statement(), request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    rows = export_rows(stmt, current_app.config.get('EXPORT_BATCH_SIZE', 1000))
+    if fmt == 'csv':
+        body, mimetype = generate_csv(rows), 'text/csv'
+    else:
+        body, mimetype = generate_ndjson(rows), 'application/x-ndjson'
+    
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=orders.{fmt}'}
+    )
+
+@admin_bp.route('/invoices', methods=['GET'])
+@login_required
+def export_invoices():
+    """Zip archive of invoices for orders in a date range (admin only)"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    try:
+        check_archive_range(request.args, current_app.config.get('INVOICE_ARCHIVE_MAX_DAYS', 31))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    archive = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+    try:
+        write_archive(archive_query(request.args), archive, current_app.extensions['invoice_pool'])
+    except ValueError as e:
+        archive.close()
+        return jsonify({'error': str(e)}), 400
+    
+    archive.seek(0)
+    return send_file(archive, mimetype='application/zip', as_attachment=True, download_name='invoices.zip')
+
+@admin_bp.route('/slow-queries', methods=['GET', 'DELETE'])
+@login_required
+def slow_queries():
+    """List or clear recorded slow SQL statements (admin only)"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    log = slow_query_log()
+    if log is None:
+        return jsonify({'error': 'Slow query log is disabled'}), 404
+    
+    if request.method == 'DELETE':
+        log.clear()
+        return jsonify({'message': 'Slow query log cleared'}), 200
+    
+    limit = request.args.get('limit', type=int)
+    return jsonify({
+        'threshold_ms': log.threshold * 1000,
+        'recorded': log.recorded,
+        'queries': log.recent(limit)
+    }), 200
 
 @admin_bp.route('/orders/<int:order_id>/status', methods=['PUT'])
 @login_required
@@ -344,9 +651,19 @@ def update_order_status(order_id):
     
     data = request.get_json()
     if 'status' in data:
-        order.status = data['status']
+        if data['status'] not in ORDER_STATUSES:
+            return jsonify({'error': f"status must be one of: {', '.join(ORDER_STATUSES)}"}), 400
+        # Setting the current status again is not a transition
+        if data['status'] != order.status:
+            enqueue('order.status_changed', {'order_id': order.id, 'status': data['status']})
+            record_status_change(order, order.status, data['status'])
+            order.status = data['status']
     
     order.updated_at = datetime.utcnow()
+    bump_generation(ORDERS)
     db.session.commit()
     
+    # The commit expired the order; reload it with items and products batched
+    order = order_query().filter_by(id=order_id).populate_existing().one()
+    publish_order_status(order)
     return jsonify({'message': 'Order status updated', 'order': order.to_dict()}), 200
@@ -0,0 +1,18 @@
+"""
+Run the background job worker
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.app import create_app
+from backend.jobs import Worker
+
+if __name__ == '__main__':
+    app = create_app()
+    worker = Worker(app)
+    print("Starting Toady Bakery job worker...")
+    print(f"{worker.concurrency} threads polling every {worker.poll_interval}s")
+    worker.run()
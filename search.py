@@ -0,0 +1,96 @@
+"""
+Full-text product search over an FTS5 index
+"""
+import re
+from sqlalchemy import func, literal_column, table, column, text
+from .models import db, Product
+from .serializers import product_query, product_dicts
+
+# External-content FTS5 table: the text lives in products, the index in
+# products_fts. Prefix indexes on 2 and 3 characters keep typeahead
+# lookups for short prefixes from walking the whole term list.
+SEARCH_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description, category,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+    END
+    """,
+    # Stock and price changes on every checkout do not touch the index
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, description, category ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+        INSERT INTO products_fts(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END
+    """,
+]
+
+# bm25 column weights: name, description, category
+RANK_WEIGHTS = (10.0, 1.0, 4.0)
+
+TOKEN = re.compile(r'\w+')
+
+products_fts = table('products_fts', column('rowid'))
+
+def ensure_search_index():
+    """Create the FTS table and its triggers, indexing existing products once
+
+    Returns True if the index was newly built.
+    """
+    with db.engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        )).first()
+        for statement in SEARCH_SCHEMA:
+            conn.execute(text(statement))
+        if not exists:
+            conn.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+    return not exists
+
+def match_expression(q):
+    """FTS5 query matching every word of ``q``, the last one as a prefix
+
+    Words are quoted so user input cannot inject FTS operators. A trailing
+    space means the last word is finished and is matched exactly.
+    Returns None if ``q`` has no words.
+    """
+    terms = [f'"{token}"' for token in TOKEN.findall(q)]
+    if not terms:
+        return None
+    if not q[-1].isspace():
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+def search_products(expression, limit, offset=0):
+    """Available products matching an FTS5 expression, best match first
+
+    Fetches one extra row to tell whether another page exists; returns
+    (products, next_offset).
+    """
+    fts = literal_column('products_fts')
+    rows = (
+        product_query()
+        .join(products_fts, products_fts.c.rowid == Product.id)
+        .filter(fts.op('MATCH')(expression), Product.is_available == True)
+        .order_by(func.bm25(fts, *RANK_WEIGHTS), Product.id)
+        .limit(limit + 1)
+        .offset(offset)
+        .all()
+    )
+    next_offset = offset + limit if len(rows) > limit else None
+    return product_dicts(rows[:limit]), next_offset
@@ -1,14 +1,30 @@
 """
 Seed initial data to the database
+
+    python seed.py                      # demo catalog, admin and demo users
+    python seed.py --users 100000 --orders 1000000 --seed 42
+                                        # plus synthetic customers and order history
 """
+import argparse
+import bisect
+import math
+import random
 import sys
 import os
+import time
+from datetime import datetime, timedelta
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from backend.app import create_app
-from backend.models import db, Product, User
+from backend.models import db, Product, User, Order, OrderItem, OrderStatusEvent
+from backend.rollups import rebuild_rollups
+from backend.catalog import bump_catalog_version
+from backend.generations import bump_generation, USERS
+from sqlalchemy import func
+
+CATEGORIES = ['Cakes', 'Cupcakes', 'Pastries', 'Breads', 'Cookies', 'Custom']
 
 def seed_data():
     """Add sample data to database"""
@@ -99,7 +115,229 @@ def seed_data():
     db.session.commit()
     print("Database seeded successfully!")
 
-if __name__ == '__main__':
+def weighted_picker(rng, weights):
+    """Return a function that draws an index with the given relative weights"""
+    cumulative = []
+    total = 0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return lambda: bisect.bisect_right(cumulative, rng.random() * total)
+
+def day_weights(start, days):
+    """Relative order volume per day: yearly cycle, weekends and December peak"""
+    weights = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        weight = 1 + 0.25 * math.sin(2 * math.pi * day.timetuple().tm_yday / 365.25)
+        if day.weekday() >= 5:
+            weight *= 1.4
+        if day.month == 12 and day.day <= 24:
+            weight *= 1.8
+        # Business grows over the period
+        weight *= 0.7 + 0.6 * offset / max(days - 1, 1)
+        weights.append(weight)
+    return weights
+
+def order_status(rng, age_days):
+    """Older orders have progressed further through fulfilment"""
+    if age_days > 14:
+        return 'cancelled' if rng.random() < 0.04 else 'delivered'
+    if age_days > 3:
+        return rng.choice(['confirmed', 'shipped', 'shipped', 'delivered'])
+    return rng.choice(['pending', 'pending', 'confirmed'])
+
+STATUS_PATHS = {
+    'pending': ['pending'],
+    'confirmed': ['pending', 'confirmed'],
+    'shipped': ['pending', 'confirmed', 'shipped'],
+    'delivered': ['pending', 'confirmed', 'shipped', 'delivered'],
+    'cancelled': ['pending', 'cancelled'],
+}
+
+def status_events(rng, order_id, status, created, updated):
+    """Status history rows leading from checkout to ``status`` at ``updated``"""
+    path = STATUS_PATHS[status]
+    span = (updated - created).total_seconds()
+    stamps = [created] + [created + timedelta(seconds=s) for s in sorted(rng.uniform(0, span) for _ in path[2:])]
+    if len(path) > 1:
+        stamps.append(updated)
+    return [
+        {'order_id': order_id, 'from_status': previous, 'to_status': current, 'created_at': at}
+        for previous, current, at in zip([None] + path, path, stamps)
+    ]
+
+def insert_batches(table, rows, batch_size, stats):
+    """executemany ``rows`` into ``table`` with one transaction per batch"""
+    batch = []
+    started = time.perf_counter()
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            with db.engine.begin() as conn:
+                conn.execute(table.insert(), batch)
+            stats[table.name] = stats.get(table.name, 0) + len(batch)
+            batch = []
+    if batch:
+        with db.engine.begin() as conn:
+            conn.execute(table.insert(), batch)
+        stats[table.name] = stats.get(table.name, 0) + len(batch)
+    return time.perf_counter() - started
+
+def generate_data(users=0, products=0, orders=0, days=365, seed=0, end_date=None, batch_size=10000):
+    """Bulk-generate customers, products and order history
+
+    The same ``seed`` and ``end_date`` always produce the same rows. Product
+    popularity follows a Zipf curve, customer activity a Pareto curve (a few
+    regulars place most orders), and order dates follow the seasonal
+    day_weights. Returns rows written and elapsed seconds per table.
+    """
+    rng = random.Random(seed)
+    end_date = end_date or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start_date = end_date - timedelta(days=days)
+    stats, timings = {}, {}
+
+    def next_id(model):
+        return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+    # Products
+    first_product = next_id(Product)
+    def product_rows():
+        for i in range(products):
+            created = start_date - timedelta(days=rng.randint(0, 365))
+            yield {
+                'id': first_product + i,
+                'name': f'{rng.choice(["Classic", "Deluxe", "Mini", "Family", "Vegan"])} '
+                        f'{rng.choice(CATEGORIES)} #{first_product + i}',
+                'description': 'Generated product',
+                'price': round(rng.lognormvariate(3, 0.6), 2),
+                'category': rng.choice(CATEGORIES),
+                'stock': rng.randint(0, 200),
+                'is_available': rng.random() > 0.05,
+                'created_at': created,
+                'updated_at': created,
+            }
+    timings['products'] = insert_batches(Product.__table__, product_rows(), batch_size, stats)
+
+    # Customers share one password hash; hashing millions of passwords would dominate the run
+    template = User()
+    template.set_password('password')
+    first_user = next_id(User)
+    def user_rows():
+        for i in range(users):
+            uid = first_user + i
+            created = start_date + timedelta(seconds=rng.randint(0, days * 86400))
+            yield {
+                'id': uid,
+                'username': f'customer{uid}',
+                'email': f'customer{uid}@example.com',
+                'password_hash': template.password_hash,
+                'first_name': rng.choice(['Alex', 'Sam', 'Priya', 'Jordan', 'Mei', 'Luca', 'Ana', 'Omar']),
+                'last_name': rng.choice(['Smith', 'Patel', 'Garcia', 'Chen', 'Okafor', 'Rossi', 'Kim']),
+                'is_admin': False,
+                'created_at': created,
+                'updated_at': created,
+            }
+    timings['users'] = insert_batches(User.__table__, user_rows(), batch_size, stats)
+
+    if orders:
+        catalog = db.session.query(Product.id, Product.price).order_by(Product.id).all()
+        customers = [uid for uid, in db.session.query(User.id).filter_by(is_admin=False).order_by(User.id)]
+        if not catalog or not customers:
+            raise ValueError('Orders need at least one product and one customer')
+
+        pick_product = weighted_picker(rng, [1 / (rank + 1) ** 1.1 for rank in range(len(catalog))])
+        pick_customer = weighted_picker(rng, [rng.paretovariate(1.2) for _ in customers])
+        pick_day = weighted_picker(rng, day_weights(start_date, days))
+        first_order = next_id(Order)
+        first_item = next_id(OrderItem)
+        items = []
+        events = []
+
+        def order_rows():
+            item_id = first_item
+            for i in range(orders):
+                day = pick_day()
+                # Afternoon-heavy time of day
+                seconds = int(min(max(rng.gauss(15 * 3600, 3 * 3600), 0), 86399))
+                created = start_date + timedelta(days=day, seconds=seconds)
+                lines = {}
+                for _ in range(min(1 + int(rng.expovariate(0.9)), 8)):
+                    product_id, price = catalog[pick_product()]
+                    quantity = lines.get(product_id, (0, price))[0] + rng.choice([1, 1, 1, 2, 3])
+                    lines[product_id] = (quantity, price)
+                for product_id, (quantity, price) in lines.items():
+                    items.append({
+                        'id': item_id, 'order_id': first_order + i, 'product_id': product_id,
+                        'quantity': quantity, 'unit_price': price,
+                    })
+                    item_id += 1
+                status = order_status(rng, days - day)
+                updated = created + timedelta(hours=rng.randint(0, 72))
+                events.extend(status_events(rng, first_order + i, status, created, updated))
+                yield {
+                    'id': first_order + i,
+                    'user_id': customers[pick_customer()],
+                    'total_amount': round(sum(q * p for q, p in lines.values()), 2),
+                    'status': status,
+                    'created_at': created,
+                    'updated_at': updated,
+                }
+
+        def order_batches():
+            # Interleave so order items and status events are flushed right after their orders
+            for row in order_rows():
+                yield row
+                if len(items) >= batch_size:
+                    timings['order_items'] = timings.get('order_items', 0) + insert_batches(
+                        OrderItem.__table__, items, batch_size, stats)
+                    items.clear()
+                if len(events) >= batch_size:
+                    timings['order_status_events'] = timings.get('order_status_events', 0) + insert_batches(
+                        OrderStatusEvent.__table__, events, batch_size, stats)
+                    events.clear()
+
+        elapsed = insert_batches(Order.__table__, order_batches(), batch_size, stats)
+        timings['orders'] = elapsed - timings.get('order_items', 0) - timings.get('order_status_events', 0)
+        timings['order_items'] = timings.get('order_items', 0) + insert_batches(
+            OrderItem.__table__, items, batch_size, stats)
+        timings['order_status_events'] = timings.get('order_status_events', 0) + insert_batches(
+            OrderStatusEvent.__table__, events, batch_size, stats)
+
+    if products:
+        bump_catalog_version()
+    if users:
+        bump_generation(USERS)
+    db.session.commit()
+    started = time.perf_counter()
+    rebuild_rollups()
+    timings['rollups'] = time.perf_counter() - started
+    return stats, timings
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed the Toady Bakery database')
+    parser.add_argument('--users', type=int, default=0, help='synthetic customers to add')
+    parser.add_argument('--products', type=int, default=0, help='synthetic products to add')
+    parser.add_argument('--orders', type=int, default=0, help='synthetic orders to add')
+    parser.add_argument('--days', type=int, default=365, help='span of order history')
+    parser.add_argument('--end-date', type=datetime.fromisoformat, help='last day of history (default: today)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for reproducible data')
+    parser.add_argument('--batch-size', type=int, default=10000, help='rows per insert transaction')
+    args = parser.parse_args()
+
     app = create_app()
     with app.app_context():
         seed_data()
+        if args.users or args.products or args.orders:
+            stats, timings = generate_data(
+                args.users, args.products, args.orders, args.days,
+                args.seed, args.end_date, args.batch_size
+            )
+            for table, rows in stats.items():
+                seconds = timings.get(table, 0)
+                rate = rows / seconds if seconds else 0
+                print(f'{table:<12}{rows:>12,} rows {seconds:>9.2f}s {rate:>12,.0f} rows/s')
+            print(f"{'rollups':<12}{'':>17}{timings['rollups']:>9.2f}s")
+
+if __name__ == '__main__':
+    main()
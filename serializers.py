@@ -0,0 +1,127 @@
+"""
+Column-level serialization for list endpoints and an orjson-backed JSON provider
+"""
+import re
+from itertools import groupby
+from flask.json.provider import DefaultJSONProvider
+from .models import db, Product, Order, OrderItem
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PRODUCT_COLUMNS = (
+    Product.id, Product.name, Product.description, Product.price,
+    Product.category, Product.image_url, Product.stock, Product.is_available
+)
+
+# Floats that repr() writes in exponent form: orjson prints 1e16 for 1e+16
+# and 0.00001 for 1e-05, so bodies containing either are re-encoded
+EXPONENT_FLOAT = re.compile(rb'\de-?\d|(?<![\d.])0\.0000\d')
+PRODUCT_KEYS = ('id', 'name', 'description', 'price', 'category', 'image_url', 'stock', 'is_available')
+
+ORDER_COLUMNS = (
+    Order.id, Order.user_id, Order.total_amount, Order.status, Order.delivery_date,
+    Order.special_instructions, Order.created_at, Order.updated_at
+)
+
+def product_query():
+    """Query of the columns in Product.to_dict, as plain rows"""
+    return db.session.query(*PRODUCT_COLUMNS)
+
+def product_dicts(rows):
+    """Product.to_dict shapes from product_query rows"""
+    return [dict(zip(PRODUCT_KEYS, row)) for row in rows]
+
+def order_query_rows():
+    """Query of the columns in Order.to_dict, as plain rows
+
+    The rows keep ``id`` and ``created_at`` attributes, so the same order
+    filters and keyset pagination apply as for the ORM query.
+    """
+    return db.session.query(*ORDER_COLUMNS)
+
+def order_dicts(rows):
+    """Order.to_dict shapes for order rows, loading every item in one query"""
+    order_ids = [row.id for row in rows]
+    items = {}
+    if order_ids:
+        item_rows = db.session.execute(
+            db.select(
+                OrderItem.order_id, OrderItem.id, OrderItem.product_id, Product.name,
+                OrderItem.quantity, OrderItem.unit_price
+            ).join(Product, Product.id == OrderItem.product_id)
+            .where(OrderItem.order_id.in_(order_ids))
+            .order_by(OrderItem.order_id, OrderItem.id)
+        )
+        for order_id, group in groupby(item_rows, key=lambda row: row[0]):
+            items[order_id] = [
+                {
+                    'id': item_id,
+                    'product_id': product_id,
+                    'product_name': product_name,
+                    'quantity': quantity,
+                    'unit_price': unit_price,
+                    'total_price': quantity * unit_price
+                }
+                for _, item_id, product_id, product_name, quantity, unit_price in group
+            ]
+
+    return [
+        {
+            'id': order_id,
+            'user_id': user_id,
+            'total_amount': total_amount,
+            'status': status,
+            'delivery_date': delivery_date.isoformat() if delivery_date else None,
+            'special_instructions': special_instructions,
+            'items': items.get(order_id, []),
+            'created_at': created_at.isoformat(),
+            'updated_at': updated_at.isoformat()
+        }
+        for order_id, user_id, total_amount, status, delivery_date,
+            special_instructions, created_at, updated_at in rows
+    ]
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Encodes responses with orjson, byte for byte like the default provider
+
+    Datetimes and dataclasses are passed to the default provider's
+    ``default`` hook so they format the same way. orjson cannot escape
+    non-ASCII text, so such bodies (and anything orjson rejects) are
+    re-encoded by the stdlib encoder, as are bodies with floats the two
+    format differently (very large or very small magnitudes). NaN and
+    infinity still differ: orjson writes null where the stdlib writes the
+    non-standard NaN/Infinity. ``dumps`` is left to the stdlib, since
+    sessions and other callers pass json.dumps keyword arguments.
+    """
+
+    def _encode(self, obj, indent):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            body = orjson.dumps(obj, default=self.default, option=option)
+        except TypeError:
+            return None
+        if self.ensure_ascii and not body.isascii():
+            return None
+        if EXPONENT_FLOAT.search(body):
+            return None
+        return body
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = self._encode(obj, indent)
+        if body is None:
+            return super().response(obj)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+def init_json_provider(app):
+    """Use OrjsonProvider when orjson is installed and FAST_JSON is on"""
+    if orjson is not None and app.config.get('FAST_JSON', True):
+        app.json = OrjsonProvider(app)
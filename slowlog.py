@@ -0,0 +1,110 @@
+"""
+Opt-in recorder of slow SQL statements with their query plans
+"""
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from flask import current_app, request, has_request_context
+from sqlalchemy import event
+
+class SlowQueryLog:
+    """Ring buffer of statements slower than ``threshold_ms``, optionally mirrored to a JSONL file
+
+    Only the types of bound parameters are kept, never their values, so
+    passwords and emails do not end up in the log.
+    """
+
+    def __init__(self, threshold_ms=100, max_entries=200, path=None):
+        self.threshold = threshold_ms / 1000
+        self.path = path
+        self.entries = deque(maxlen=max_entries)
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def record(self, entry):
+        with self._lock:
+            self.recorded += 1
+            self.entries.append(entry)
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(entry) + '\n')
+
+    def recent(self, limit=None):
+        """Newest entries first"""
+        with self._lock:
+            entries = list(self.entries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+def parameter_shape(parameters, executemany):
+    """Type names of the bound parameters, plus the row count for executemany"""
+    if executemany:
+        rows = list(parameters)
+        return {'rows': len(rows), 'types': parameter_shape(rows[0], False) if rows else []}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+def explain(dbapi_connection, statement, parameters, executemany):
+    """EXPLAIN QUERY PLAN details for a statement, or None if SQLite rejects it"""
+    if executemany:
+        parameters = next(iter(parameters), ())
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters or ())
+        return [row[3] for row in cursor.fetchall()]
+    except Exception:
+        return None
+    finally:
+        cursor.close()
+
+def install_slow_query_log(engine, log):
+    """Time every statement on ``engine`` and record the slow ones in ``log``"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['slow_query_start'].pop()
+        if elapsed < log.threshold:
+            return
+        log.record({
+            'timestamp': datetime.utcnow().isoformat(),
+            'duration_ms': round(elapsed * 1000, 3),
+            'route': request.endpoint if has_request_context() else None,
+            'statement': statement,
+            'parameters': parameter_shape(parameters, executemany),
+            'plan': explain(cursor.connection, statement, parameters, executemany)
+        })
+
+    @event.listens_for(engine, 'handle_error')
+    def failed_query(context):
+        # A failed statement never reaches after_cursor_execute
+        conn = context.connection
+        starts = conn.info.get('slow_query_start') if conn is not None else None
+        if starts:
+            starts.pop()
+
+def init_slow_query_log(app, engine):
+    """Create the app's SlowQueryLog if SLOW_QUERY_LOG_ENABLED is set"""
+    if not app.config.get('SLOW_QUERY_LOG_ENABLED'):
+        return None
+    log = SlowQueryLog(
+        app.config.get('SLOW_QUERY_THRESHOLD_MS', 100),
+        app.config.get('SLOW_QUERY_LOG_SIZE', 200),
+        app.config.get('SLOW_QUERY_LOG_FILE')
+    )
+    install_slow_query_log(engine, log)
+    app.extensions['slow_query_log'] = log
+    return log
+
+def slow_query_log():
+    """The app's SlowQueryLog, or None when the recorder is off"""
+    return current_app.extensions.get('slow_query_log')
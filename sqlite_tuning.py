@@ -0,0 +1,16 @@
+"""
+Per-connection SQLite pragmas for the configured engine
+"""
+from sqlalchemy import event
+
+def apply_pragmas(engine, pragmas):
+    """Run ``PRAGMA name=value`` for every pragma on each new DBAPI connection"""
+    if not pragmas or engine.dialect.name != 'sqlite':
+        return
+    
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
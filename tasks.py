@@ -0,0 +1,63 @@
+"""
+Background work triggered by checkout and order status changes
+"""
+from flask import current_app
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .models import db, Order, OrderItem, Product, SentNotification
+from .jobs import job_handler
+from .loading import order_query
+from .invoices import cached_invoice
+
+def send_notification(user, key, subject, body):
+    """Deliver a customer notification once per ``key``
+
+    The marker row is committed right after sending, so a retried job skips
+    notifications an earlier attempt already delivered. No mail transport is
+    configured yet, so messages go to the app log.
+    """
+    marked = db.session.execute(
+        sqlite_insert(SentNotification).values(key=key, user_id=user.id)
+        .on_conflict_do_nothing(index_elements=['key'])
+    )
+    if marked.rowcount == 0:
+        return
+    current_app.logger.info('Notification to %s <%s>: %s\n%s', user.username, user.email, subject, body)
+    db.session.commit()
+
+@job_handler('order.placed')
+def order_placed(payload):
+    """Confirm a new order, render its invoice ahead of time and flag products running low"""
+    order = order_query().filter_by(id=payload['order_id']).first()
+    if order is None:
+        return
+    
+    cached_invoice(order)
+    
+    send_notification(
+        order.user,
+        f'order.placed:{order.id}',
+        f'Order #{order.id} received',
+        f'Thanks for your order of ${order.total_amount:.2f}. We will let you know when it ships.'
+    )
+    
+    # Reads current stock, so a repeated run reports the same products
+    threshold = current_app.config.get('LOW_STOCK_THRESHOLD', 5)
+    low_stock = db.session.query(Product.id, Product.name, Product.stock).join(
+        OrderItem, OrderItem.product_id == Product.id
+    ).filter(OrderItem.order_id == order.id, Product.stock <= threshold).distinct().all()
+    for product in low_stock:
+        current_app.logger.warning('Low stock: %s (#%s) has %s left', product.name, product.id, product.stock)
+
+@job_handler('order.status_changed')
+def order_status_changed(payload):
+    """Tell the customer their order moved to a new status"""
+    order = db.session.get(Order, payload['order_id'])
+    if order is None:
+        return
+    
+    send_notification(
+        order.user,
+        f"order.status_changed:{order.id}:{payload['status']}",
+        f"Order #{order.id} is {payload['status']}",
+        f"Your order #{order.id} is now {payload['status']}."
+    )
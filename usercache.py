@@ -0,0 +1,100 @@
+"""
+Bounded TTL cache of user records for flask_login's user_loader
+"""
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from .models import db, User
+
+class UserCache:
+    """LRU of detached User snapshots that expire after ``ttl`` seconds"""
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id, snapshot):
+        with self._lock:
+            self.entries[user_id] = (time.monotonic() + self.ttl, snapshot)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+def _snapshot(user):
+    """Detached copy of a user's column values, independent of any session"""
+    copy = User()
+    for column in inspect(User).column_attrs:
+        set_committed_value(copy, column.key, getattr(user, column.key))
+    make_transient_to_detached(copy)
+    return copy
+
+def load_user(user_id):
+    """Return the user for a session cookie, skipping the users table on a hit"""
+    cache = current_app.extensions['user_cache']
+    user_id = int(user_id)
+
+    snapshot = cache.get(user_id)
+    if snapshot is not None:
+        # Attach a fresh copy to this request's session without a SELECT
+        return db.session.merge(snapshot, load=False)
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        cache.put(user_id, _snapshot(user))
+    return user
+
+def invalidate_user(user_id):
+    """Drop a user from this process's cache
+
+    Other worker processes keep their copy until its TTL runs out, which is
+    what bounds cross-process staleness.
+    """
+    if has_app_context():
+        current_app.extensions['user_cache'].invalidate(user_id)
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _mark_stale(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('stale_users', set()).add(target.id)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_stale(session):
+    for user_id in session.info.pop('stale_users', ()):
+        invalidate_user(user_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_stale(session):
+    session.info.pop('stale_users', None)